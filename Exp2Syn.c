@@ -33,6 +33,11 @@ typedef struct {
   double Gmax;    /* The maximum conductance */
   double Er;      /* The driving potential */
   double tau1, tau2;
+  double peak;          /* peak of the unit conductance ... */
+  double peaktau1, peaktau2;  /* ... for this tau1 and tau2 */
+  int    exact;         /* exact exponential decay in HIupdate */
+  double decay1, decay2;  /* decay of A and B over a step decayh ... */
+  double decayh, decaytau1, decaytau2;  /* ... with this tau1 and tau2 */
 }  Exp2Syn;
 
 
@@ -50,22 +55,35 @@ static PyMemberDef Exp2Syn_members[] = {
     {"Er", T_DOUBLE, offsetof(Exp2Syn, Er), 0, "reversal potential"},
     {"tau1", T_DOUBLE, offsetof(Exp2Syn, tau1), 0, "rise time"},
     {"tau2", T_DOUBLE, offsetof(Exp2Syn, tau2), 0, "decay time"},
+    {"exact", T_INT, offsetof(Exp2Syn, exact), 0,
+     "decay exactly, not by the trapezoidal rule, in Hines steps"},
     {NULL},
 };
 
-static void update(Exp2Syn *self, double strength) {
-  double A = GETSTATE_DYN(self, 0);
-  double B = GETSTATE_DYN(self, 1);
-  double factor, tp;
+static double peak(Exp2Syn *self) {
+  /* The peak conductance of a unit event, found again only when tau1
+     or tau2 have been changed since it was last found. */
+  double tp;
   double tau1 = self->tau1;
   double tau2 = self->tau2;
 
+  if( tau1==self->peaktau1 && tau2==self->peaktau2 )
+    return self->peak;
+
   if (tau1/tau2 > .9999) { 
     tau1 = .9999*tau2; 
   } 
   tp = (tau1*tau2)/(tau2 - tau1) * log(tau2/tau1);
-  factor = -exp(-tp/tau1) + exp(-tp/tau2);
-  factor = strength/factor;
+  self->peak     = -exp(-tp/tau1) + exp(-tp/tau2);
+  self->peaktau1 = self->tau1;
+  self->peaktau2 = self->tau2;
+  return self->peak;
+}
+
+static void update(Exp2Syn *self, double strength) {
+  double A = GETSTATE_DYN(self, 0);
+  double B = GETSTATE_DYN(self, 1);
+  double factor = strength/peak(self);
  
   A += factor;
   B += factor;
@@ -92,6 +110,8 @@ static void Exp2Syn_derivs(Exp2Syn *self, double t) {
 static int Exp2SynInit(Exp2Syn *self) {
   SETSTATE_DYN(self, 0, 0);
   SETSTATE_DYN(self, 1, 0);
+  self->peaktau1 = self->peaktau2 = 0;  /* no peak found yet */
+  self->decayh = 0;
   return 0;
 }
 
@@ -101,8 +121,23 @@ static void HIupdate(Exp2Syn *self, double t, double h) {
   double tau1 = 2*self->tau1;
   double tau2 = 2*self->tau2;
 
-  A *= (tau1-h)/(tau1+h);
-  B *= (tau2-h)/(tau2+h);
+  if( self->exact ) {
+    /* A and B decay independently, so exp(-h/tau) is exact for any
+       h. The adaptive step is often repeated, so keep the last. */
+    if( h!=self->decayh || self->tau1!=self->decaytau1 ||
+        self->tau2!=self->decaytau2 ) {
+      self->decay1 = exp(-h/self->tau1);
+      self->decay2 = exp(-h/self->tau2);
+      self->decayh = h;
+      self->decaytau1 = self->tau1;
+      self->decaytau2 = self->tau2;
+    }
+    A *= self->decay1;
+    B *= self->decay2;
+  } else {
+    A *= (tau1-h)/(tau1+h);
+    B *= (tau2-h)/(tau2+h);
+  }
 
   SETSTATE_DYN(self, 0, A);
   SETSTATE_DYN(self, 1, B);
@@ -0,0 +1,252 @@
+"""
+Network activity measures from spike (AP) files.
+
+The spikes are loaded once into compressed sparse row form: the spike
+times of cell i are times[indptr[i]:indptr[i+1]], in time order. All
+the measures are computed with whole array numpy operations, never a
+Python loop over spikes, so they scale to runs with millions of them.
+
+Times are in ms and rates in Hz.
+
+   s = load('ap sprout=1.dat', layout=(500, 6, 15, 6), duration=400)
+   s.typeRates()
+   s.fractionActive('Granule cell')
+   (edges, rate) = s.psth(binsize=1, typename='Granule cell')
+
+Usage:
+   python analysis.py [-n ngcell,nbcell,nmcell,nhcell] [-d duration] apfile ...
+"""
+
+import sys
+import numpy
+import spikes
+
+# The cell types of the network in makeNetwork order
+TYPENAMES = ['Granule cell', 'Basket cell', 'Mossy cell', 'HIPP cell']
+LAYOUT    = (500, 6, 15, 6)
+
+
+def networkTypes(layout=LAYOUT):
+    """The type code of each cell of a network with (ngcell, nbcell,
+    nmcell, nhcell) cells. Returns (celltypes, typenames)"""
+    celltypes = numpy.repeat(numpy.arange(len(layout), dtype='u1'), layout)
+    return (celltypes, list(TYPENAMES))
+
+
+class Spikes:
+    """The spike trains of a network in CSR form. types are the type
+    codes (into typenames) of the spikes, or if celltypes is given the
+    type codes of all the cells"""
+    def __init__(self, cells, times, types, typenames, ncells=None,
+                 celltypes=None, duration=None):
+        cells = numpy.asarray(cells, dtype=numpy.int64)
+        times = numpy.asarray(times, dtype=numpy.float64)
+        types = numpy.asarray(types)
+        nmin = cells.max()+1 if len(cells) else 0
+        if ncells is None and celltypes is not None:
+            ncells = len(celltypes)
+        if ncells is None:
+            ncells = nmin
+        if ncells<nmin:
+            raise ValueError, 'spikes of cell %d in a network of %d cells' % \
+                  (nmin-1, ncells)
+        # stable sorts by time then cell, the first often a no-op as
+        # AP files are close to time order
+        if len(times)>1 and (times[1:]>=times[:-1]).all():
+            order = numpy.arange(len(times))
+        else:
+            order = numpy.argsort(times, kind='mergesort')
+        order = order[numpy.argsort(cells[order], kind='mergesort')]
+        self.times  = times[order]
+        self.cells  = cells[order]
+        self.indptr = numpy.zeros(ncells+1, dtype=numpy.int64)
+        self.indptr[1:] = numpy.cumsum(numpy.bincount(cells,
+                                                      minlength=ncells))
+        self.ncells = ncells
+        self.typenames = list(typenames)
+        if celltypes is None:
+            # the type of each cell from its spikes, 255 if silent
+            celltypes = numpy.empty(ncells, dtype='u1')
+            celltypes.fill(255)
+            celltypes[cells] = types
+        else:
+            celltypes = numpy.asarray(celltypes, dtype='u1')
+        self.celltypes = celltypes
+        if duration is None:
+            duration = numpy.ceil(self.times.max()) if len(times) else 0.
+        self.duration = float(duration)
+
+    def __len__(self):
+        return len(self.times)
+
+    def train(self, i):
+        """The spike times of cell i"""
+        return self.times[self.indptr[i]:self.indptr[i+1]]
+
+    def ofType(self, typename):
+        """Mask of the cells of a type"""
+        if typename is None:
+            return numpy.ones(self.ncells, dtype=bool)
+        return self.celltypes==self.typenames.index(typename)
+
+    def counts(self, t0=0., t1=None):
+        """Number of spikes of each cell in [t0, t1)"""
+        if t0<=0 and t1 is None:
+            return numpy.diff(self.indptr)
+        if t1 is None: t1 = numpy.inf
+        sel = (self.times>=t0) & (self.times<t1)
+        return numpy.bincount(self.cells[sel], minlength=self.ncells)
+
+    def rates(self, t0=0., t1=None):
+        """Firing rate of each cell over [t0, t1)"""
+        if t1 is None: t1 = self.duration
+        return self.counts(t0, t1)*1000./max(t1-t0, 1e-9)
+
+    def typeRates(self, t0=0., t1=None):
+        """Mean firing rate of the cells of each type"""
+        r = self.rates(t0, t1)
+        result = {}
+        for (code, name) in enumerate(self.typenames):
+            sel = self.celltypes==code
+            if sel.any():
+                result[name] = r[sel].mean()
+        return result
+
+    def fractionActive(self, typename=None, minspikes=1):
+        """Fraction of the cells of a type that fire at least minspikes"""
+        sel = self.ofType(typename)
+        if not sel.any(): return 0.
+        return (self.counts()[sel]>=minspikes).mean()
+
+    def psth(self, binsize=1., typename=None, t0=0., t1=None):
+        """Population peri-stimulus time histogram of the cells of a
+        type, as the mean rate per cell in each bin.
+        Returns (bin edges, rates)"""
+        if t1 is None: t1 = self.duration
+        edges = numpy.arange(t0, t1+binsize*0.5, binsize)
+        sel = self.ofType(typename)[self.cells]
+        (h, edges) = numpy.histogram(self.times[sel], edges)
+        n = max(self.ofType(typename).sum(), 1)
+        return (edges, h*1000./(n*binsize))
+
+    def binned(self, binsize=5., cells=None, t0=0., t1=None):
+        """Spike counts of the given cells (default all) in bins,
+        a len(cells) x nbins array"""
+        if t1 is None: t1 = self.duration
+        if cells is None: cells = numpy.arange(self.ncells)
+        cells = numpy.asarray(cells)
+        nbins = int(numpy.ceil((t1-t0)/binsize))
+        row = -numpy.ones(self.ncells, dtype=numpy.int64)
+        row[cells] = numpy.arange(len(cells))
+        sel = (row[self.cells]>=0) & (self.times>=t0) & (self.times<t1)
+        b = ((self.times[sel]-t0)//binsize).astype(numpy.int64)
+        flat = row[self.cells[sel]]*nbins + b
+        return numpy.bincount(flat, minlength=len(cells)*nbins
+                              ).reshape(len(cells), nbins)
+
+    def synchrony(self, binsize=5., typename=None, t0=0., t1=None,
+                  matrix=False):
+        """Pairwise synchrony of the active cells of a type: the
+        correlation coefficients of their binned spike counts.
+        Returns (mean over pairs, cells, correlation matrix), the
+        matrix being None unless asked for"""
+        cells = numpy.nonzero(self.ofType(typename) & (self.counts()>0))[0]
+        x = self.binned(binsize, cells, t0, t1).astype(numpy.float64)
+        x = x - x.mean(axis=1)[:, None]
+        sd = numpy.sqrt((x*x).sum(axis=1))
+        ok = sd>0
+        (cells, x, sd) = (cells[ok], x[ok], sd[ok])
+        x = x/sd[:, None]
+        n = len(cells)
+        c = None
+        if matrix:
+            c = numpy.dot(x, x.T)
+        if n<2:
+            return (numpy.nan, cells, c)
+        # the rows have unit norm, so the off diagonal correlations sum
+        # to |sum of the rows|^2 - n, no need for the n x n matrix
+        s = x.sum(axis=0)
+        mean = (numpy.dot(s, s) - n)/(n*(n-1))
+        return (mean, cells, c)
+
+    def bursts(self, maxisi=10., minspikes=3):
+        """Bursts, runs of at least minspikes spikes of one cell with
+        no interval longer than maxisi. Returns arrays
+        (cell, start time, end time, number of spikes), one per burst"""
+        if len(self.times)<2:
+            z = numpy.zeros(0)
+            return (z.astype(numpy.int64), z, z, z.astype(numpy.int64))
+        close = (numpy.diff(self.times)<=maxisi) & \
+                (self.cells[1:]==self.cells[:-1])
+        edge = numpy.diff(numpy.concatenate(([0], close.astype(numpy.int8),
+                                             [0])))
+        starts = numpy.nonzero(edge==1)[0]     # first spike of the run
+        ends   = numpy.nonzero(edge==-1)[0]    # last spike of the run
+        n = ends - starts + 1
+        keep = n>=minspikes
+        (starts, ends, n) = (starts[keep], ends[keep], n[keep])
+        return (self.cells[starts], self.times[starts], self.times[ends], n)
+
+    def burstOnset(self, typename=None, fraction=0.1, maxisi=10.,
+                   minspikes=3):
+        """Latency of the population burst of a type, the time by which
+        fraction of its cells have started a burst (nan if never)"""
+        (cells, start, end, n) = self.bursts(maxisi, minspikes)
+        sel = self.ofType(typename)
+        first = numpy.empty(self.ncells)
+        first.fill(numpy.inf)
+        # bursts come in cell then time order, so the first of each cell
+        # is the one with the smallest index
+        if len(cells):
+            isfirst = numpy.concatenate(([True], cells[1:]!=cells[:-1]))
+            first[cells[isfirst]] = start[isfirst]
+        first = numpy.sort(first[sel])
+        k = int(numpy.ceil(fraction*len(first))) - 1
+        if len(first)==0 or not numpy.isfinite(first[max(k, 0)]):
+            return numpy.nan
+        return first[max(k, 0)]
+
+    def summary(self, typename='Granule cell'):
+        """The usual measures of hyperexcitability, as a dict"""
+        d = {}
+        for (name, r) in self.typeRates().items():
+            d['rate %s' % name] = r
+        d['active'] = self.fractionActive(typename)
+        d['synchrony'] = self.synchrony(typename=typename)[0]
+        d['bursts'] = len(self.bursts()[0])
+        d['burst onset'] = self.burstOnset(typename)
+        return d
+
+
+def load(fn, layout=None, duration=None):
+    """Load an AP file of any format (see spikes.py). With the network
+    layout (ngcell, nbcell, nmcell, nhcell) silent cells are counted
+    and typed too."""
+    (cells, times, types, typenames) = spikes.load(fn)
+    celltypes = None
+    if layout is not None:
+        (celltypes, typenames) = networkTypes(layout)
+    return Spikes(cells, times, types, typenames, celltypes=celltypes,
+                  duration=duration)
+
+
+if __name__=='__main__':
+    layout = LAYOUT
+    duration = None
+    args = sys.argv[1:]
+    while len(args)>1 and args[0] in ['-n', '-d']:
+        if args[0]=='-n':
+            layout = tuple([int(x) for x in args[1].split(',')])
+        else:
+            duration = float(args[1])
+        args = args[2:]
+    if not args:
+        print 'Usage: python analysis.py [-n ngcell,nbcell,nmcell,nhcell]' \
+              ' [-d duration] apfile ...'
+        sys.exit(1)
+    for fn in args:
+        s = load(fn, layout, duration)
+        print '%s: %d spikes, %d cells, %gms' % \
+              (fn, len(s), s.ncells, s.duration)
+        for (k, v) in sorted(s.summary().items()):
+            print '  %-22s %g' % (k, v)
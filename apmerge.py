@@ -0,0 +1,231 @@
+"""
+Streaming merge of the per rank AP files of an MPI run.
+
+Each rank writes its own AP file, '<apfilename>_<size>_<rank>.dat'
+(or .spk, see support.openAPFile). A rank writes the APs of a window
+at the end of the window, so its file is in time order window by
+window. The time ordered merge puts each rank back in time order
+with a heap holding no more than a couple of windows of APs, and
+merges the ranks with another heap.
+
+The cell ordered merge is an external sort: the APs are sorted by
+cell and time in runs of at most runsize, the runs are spilled to
+temporary files and then merged, again with a heap.
+
+The output is a text AP file or a fixed width spike record file (see
+spikes.py). Both orders break ties by cell, then time.
+
+Usage:
+   python apmerge.py [-c] [-b] [-v] [-w window] -o outfile apfilename|file ...
+      -c   cell order (default time order)
+      -b   fixed width binary records (default text)
+      -v   check the output against a full sort of the input in memory
+      -w   window the run used (ms, default 20)
+"""
+
+import sys, os, re, heapq, struct, tempfile
+import numpy
+import spikes
+
+WINDOW  = 20
+RUNSIZE = 1<<20
+
+
+def rankFiles(apfilename):
+    """The per rank AP files of a run, in rank order"""
+    (d, base) = os.path.split(apfilename)
+    exp = re.compile(re.escape(base) + r'_(\d+)_(\d+)\.(dat|spk)$')
+    found = []
+    for name in os.listdir(d or '.'):
+        o = exp.match(name)
+        if o:
+            found.append((int(o.group(1)), int(o.group(2)),
+                          os.path.join(d, name)))
+    sizes = set([size for (size, rank, fn) in found])
+    if len(sizes)>1:
+        raise ValueError, '%s has files from runs of %s ranks' % \
+              (apfilename, ', '.join(map(str, sorted(sizes))))
+    found.sort()
+    return [fn for (size, rank, fn) in found]
+
+def records(fn):
+    """Yield the (cellid, time, celltype) of an AP file in file order"""
+    if fn.endswith('.spk'):
+        for (ids, times, types, typenames) in spikes.iterChunks(fn):
+            for (i, t, c) in zip(ids.tolist(), times.tolist(), types.tolist()):
+                yield (i, t, typenames[c])
+        return
+    for l in open(fn):
+        l = l.strip()
+        if not l: continue
+        (i, t, name) = l.split(' ', 2)
+        yield (int(i), float(t), name.strip('"'))
+
+def windowRuns(fn, window=WINDOW):
+    """Yield the (time, cellid, celltype) of an AP file in time order.
+    A cell may step a little past the end of a window, so the APs
+    written at the end of a window can reach into the next one but
+    none precedes the window before. Each AP is held back until the
+    file has reached two windows past it."""
+    lag = 2*window
+    heap = []
+    last = None
+    for (i, t, name) in records(fn):
+        if last is not None and t<last:
+            raise ValueError, '%s is not in window order at t=%g, ' \
+                  'is the window %g?' % (fn, t, window)
+        heapq.heappush(heap, (t, i, name))
+        while heap[0][0]<t-lag:
+            last = heap[0][0]
+            yield heapq.heappop(heap)
+    while heap:
+        yield heapq.heappop(heap)
+
+def timeOrdered(fns, window=WINDOW):
+    """Yield (cellid, time, celltype) of the files merged in time order"""
+    for (t, i, name) in heapq.merge(*[windowRuns(fn, window) for fn in fns]):
+        yield (i, t, name)
+
+
+_RUNREC = struct.Struct('<idB')
+
+def _spill(buf, codes):
+    f = tempfile.TemporaryFile()
+    for (i, t, name) in buf:
+        f.write(_RUNREC.pack(i, t, codes[name]))
+    f.seek(0)
+    return f
+
+def _readRun(f, typenames):
+    n = _RUNREC.size
+    while True:
+        b = f.read(n*4096)
+        if not b: break
+        for k in range(0, len(b), n):
+            (i, t, c) = _RUNREC.unpack_from(b, k)
+            yield (i, t, typenames[c])
+    f.close()
+
+def cellOrdered(fns, runsize=RUNSIZE):
+    """Yield (cellid, time, celltype) of the files merged in cell order,
+    by an external sort in runs of runsize"""
+    typenames = []
+    codes = {}
+    runs = []
+    buf = []
+    for fn in fns:
+        for r in records(fn):
+            if r[2] not in codes:
+                codes[r[2]] = len(typenames)
+                typenames.append(r[2])
+            buf.append(r)
+            if len(buf)>=runsize:
+                buf.sort()
+                runs.append(_spill(buf, codes))
+                buf = []
+    buf.sort()
+    if not runs:
+        for r in buf: yield r
+        return
+    if buf:
+        runs.append(_spill(buf, codes))
+    for r in heapq.merge(*[_readRun(f, typenames) for f in runs]):
+        yield r
+
+
+def merge(fns, outfn, order='time', binary=False, window=WINDOW,
+          runsize=RUNSIZE):
+    """Merge the AP files fns into outfn. Returns the number of APs"""
+    if order=='time':
+        merged = timeOrdered(fns, window)
+    elif order=='cell':
+        merged = cellOrdered(fns, runsize)
+    else:
+        raise ValueError, 'unknown order %s' % order
+    n = 0
+    if binary:
+        out = spikes.RecordWriter(outfn)
+        for (i, t, name) in merged:
+            out.write(i, t, name)
+            n = n + 1
+    else:
+        out = open(outfn, 'w')
+        for (i, t, name) in merged:
+            out.write('%d %g "%s"\n' % (i, t, name))
+            n = n + 1
+    out.close()
+    return n
+
+def check(fns, outfn, order='time'):
+    """Whether the merged file outfn (text or records, read with
+    spikes.load) holds the APs of fns in order, as a sort of all of
+    them in memory gives them. Times are compared to the 6 digits of
+    the text format."""
+    rs = []
+    for fn in fns:
+        rs.extend(records(fn))
+    if not rs:
+        return len(spikes.load(outfn)[0])==0
+    (cells, times, names) = zip(*rs)
+    (cells, times, names) = (numpy.array(cells), numpy.array(times),
+                             numpy.array(names))
+    if order=='time':
+        k = numpy.lexsort((cells, times))
+    else:
+        k = numpy.lexsort((times, cells))
+    (mcells, mtimes, mtypes, typenames) = spikes.load(outfn)
+    if len(mcells)!=len(k):
+        return False
+    mnames = numpy.array(typenames + [''])[mtypes]
+    return numpy.array_equal(mcells, cells[k]) and \
+           numpy.allclose(mtimes, times[k], rtol=1e-5, atol=0) and \
+           numpy.array_equal(mnames, names[k])
+
+def usage():
+    print 'Usage: python apmerge.py [-c] [-b] [-v] [-w window] ' \
+          '-o outfile apfilename|file ...'
+    sys.exit(1)
+
+
+if __name__=='__main__':
+    order = 'time'
+    binary = False
+    verify = False
+    window = WINDOW
+    outfn = None
+    args = sys.argv[1:]
+    while args and args[0] in ['-c', '-b', '-v', '-w', '-o']:
+        opt = args.pop(0)
+        if opt=='-c': order = 'cell'
+        elif opt=='-b': binary = True
+        elif opt=='-v': verify = True
+        else:
+            # -w and -o take a value
+            if not args or args[0].startswith('-'):
+                usage()
+            value = args.pop(0)
+            if opt=='-o':
+                outfn = value
+            else:
+                try:
+                    window = float(value)
+                except ValueError:
+                    usage()
+    if not args or not outfn:
+        usage()
+    fns = []
+    for a in args:
+        if os.path.exists(a):
+            fns.append(a)
+        else:
+            fns.extend(rankFiles(a))
+    if not fns:
+        print 'apmerge.py: no AP files found'
+        sys.exit(1)
+    n = merge(fns, outfn, order, binary, window)
+    print 'Merged %d APs from %d files into %s' % (n, len(fns), outfn)
+    if verify:
+        if not check(fns, outfn, order):
+            print 'apmerge.py: %s does not match a sort of the input' % outfn
+            sys.exit(1)
+        print 'Checked against a sort of the input'
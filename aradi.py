@@ -37,7 +37,12 @@ Mostly copied from the source on ModelDB
 import sys
 sys.path = ['C:\Documents and Settings\evan\My Documents\Visual Studio Projects\parplex']+sys.path
 
-from p3Build import VGCDynamicsBuilder, CaDynamicsBuilder, Gate, build
+from p3Build import CaDynamicsBuilder
+from gatebuild import FusedVGCDynamicsBuilder, Gate, build
+
+# python aradi.py tabulate=1 builds the gates as rate tables, see gatebuild
+FusedVGCDynamicsBuilder.tabulate = __name__=='__main__' and \
+                                   'tabulate=1' in sys.argv[1:]
 
 ######################
 # Regular Na current #
@@ -58,7 +63,7 @@ m.exponent = 3
 m.alpha = alpha_m
 m.beta  = beta_m
 
-Na = VGCDynamicsBuilder()
+Na = FusedVGCDynamicsBuilder()
 Na.gates = [h, m]
 Na.description = 'Na: Na model'
 Na.name = 'Na'
@@ -72,24 +77,33 @@ beta_h  = '3.33/(exp(-(V-Vhalfh+60-47.5)/10.0)+1)'
 h = Gate()
 h.name = 'h'
 h.exponent = 1
-h.inf = '(%s)/((%s)+(%s))' % (alpha_h, alpha_h, beta_h)
-h.tau = 'Ah/((%s)+(%s))' % (alpha_h, beta_h)
+h.alpha = alpha_h
+h.beta  = beta_h
+h.tau = 'Ah/(alpha+beta)'
+h.infShift = h.tauShift = 'Vhalfh'
+h.tauScale = 'Ah'
 
 alpha_m = '-0.3*(V-Vhalfm+60-17)/(exp((V-Vhalfm+60-17)/-5) - 1)'
 beta_m  = '0.3*(V-Vhalfm+60-45)/(exp((V-Vhalfm+60-45)/5) - 1)'
 m = Gate()
 m.name = 'm'
 m.exponent = 3
-m.inf = '(%s)/((%s)+(%s))' % (alpha_m, alpha_m, beta_m)
-m.tau = 'Am/((%s)+(%s))' % (alpha_m, beta_m)
+m.alpha = alpha_m
+m.beta  = beta_m
+m.tau = 'Am/(alpha+beta)'
+m.infShift = m.tauShift = 'Vhalfm'
+m.tauScale = 'Am'
 
 s = Gate()
 s.name = 's'
 s.exponent = 1
-s.inf = '(%s)/((%s)+(%s))' % (alpha_h, alpha_h, beta_h)
+s.alpha = alpha_h
+s.beta  = beta_h
 s.tau = 'As*cAs*exp(-cBs*V)'
+s.infShift = 'Vhalfh'
+s.tauScale = 'As'
 
-Naslow = VGCDynamicsBuilder()
+Naslow = FusedVGCDynamicsBuilder()
 Naslow.gates = [h, m, s]
 Naslow.variable('Vhalfm', 0, ' activation voltage shift')
 Naslow.variable('Vhalfh', 0, 'fast inactivation voltage shift')
@@ -112,8 +126,9 @@ n.name = 'n'
 n.exponent = 4
 n.alpha = alpha_n
 n.beta  = beta_n
+n.infShift = n.tauShift = 'Vhalfn'
 
-Kdrf = VGCDynamicsBuilder()
+Kdrf = FusedVGCDynamicsBuilder()
 Kdrf.gates = [n]
 Kdrf.variable('Vhalfn', 0, ' activation voltage shift')
 Kdrf.description = 'K: fast delayed rectifier'
@@ -125,10 +140,11 @@ Kdrf.name = 'Kdrf'
 n = Gate()
 n.alpha = '-0.028*(V-Vhalfn+65-35)/(exp((V-Vhalfn+65-35)/-6)-1)'
 n.beta  = '0.1056/exp((V-Vhalfn+65-10)/40)'
+n.infShift = n.tauShift = 'Vhalfn'
 n.name  = 'n'
 n.exponent = 4
 
-Kdrs = VGCDynamicsBuilder()
+Kdrs = FusedVGCDynamicsBuilder()
 Kdrs.gates = [n]
 Kdrs.variable('Vhalfn', 0, ' activation voltage shift')
 Kdrs.description = 'K: slow delayed rectifier'
@@ -145,6 +161,7 @@ k.tau = beta + '/(q10*a0n*(1+' + alpha + '))'
 k.name  = 'k'
 k.exponent = 1
 k.description = 'activation'
+k.infShift = k.tauShift = 'vhalfn'
 l = Gate()
 alpha = 'exp(1e-3*zetal*(V-vhalfl)*9.648e4/(8.315*(273.16+celsius)))'
 beta  = 'exp(1e-3*zetal*gml*(V-vhalfl)*9.648e4/(8.315*(273.16+celsius)))'
@@ -153,8 +170,10 @@ l.tau = beta + '/(q10*a0l*(1 + ' + alpha + '))'
 l.name  = 'l'
 l.exponent = 1
 l.description = 'inactivation'
+l.infShift = l.tauShift = 'vhalfl'
+l.Vmax = 200     # looked up at V-vhalfl, vhalfl being about -83mV
 
-Ka = VGCDynamicsBuilder()
+Ka = FusedVGCDynamicsBuilder()
 Ka.gates = [k, l]
 Ka.description = 'Ka: A current'
 Ka.name = 'Ka'
@@ -175,11 +194,12 @@ Ka.constant('q10', 0.0740) # This is different for different channels! */
 h = Gate()
 h.inf = '1 / (1 + exp( (V-Vhalfhf+91)/10 ))'
 h.tau = '14.9 + 14.1 / (1+exp(-(V+95.2)/0.5))'
+h.infShift = 'Vhalfhf'
 h.exponent = 2
 h.name = 'h'
 h.description = 'activation'
 
-Ihf = VGCDynamicsBuilder()
+Ihf = FusedVGCDynamicsBuilder()
 Ihf.gates = [h]
 Ihf.description = 'fast Ih model'
 Ihf.name = 'Ihf'
@@ -191,11 +211,12 @@ Ihf.variable('Vhalfhf', 0, ' activation voltage shift')
 h = Gate()
 h.inf = '1 / (1 + exp( (V-Vhalfhs+91)/10 ))'
 h.tau = '80 + 172.7 / (1+exp(-(V+59.3)/-0.83))'
+h.infShift = 'Vhalfhs'
 h.exponent = 2
 h.name = 'h'
 h.description = 'activation'
 
-Ihs = VGCDynamicsBuilder()
+Ihs = FusedVGCDynamicsBuilder()
 Ihs.gates = [h]
 Ihs.description = 'slow Ih model'
 Ihs.name = 'Ihs'
@@ -207,6 +228,7 @@ Ihs.variable('Vhalfhs', 0, ' activation voltage shift')
 a = Gate()
 a.alpha = '(0.2*(19.26-(V-Vhalfmt))/(exp((19.26-(V-Vhalfmt))/10)-1))'
 a.beta  = '(0.009*exp(-(V-Vhalfmt)/22.03))'
+a.infShift = a.tauShift = 'Vhalfmt'
 a.exponent = 2
 a.description = 'activation'
 a.name = 'a'
@@ -217,7 +239,7 @@ b.exponent = 1
 b.description = 'inactivation'
 b.name = 'b'
 
-CaT = VGCDynamicsBuilder()
+CaT = FusedVGCDynamicsBuilder()
 CaT.description = 'T type calcium channels'
 CaT.gates = [a, b]
 CaT.variable('Vhalfmt', 0, ' activation voltage shift')
@@ -229,6 +251,7 @@ CaT.name = 'CaT'
 c = Gate()
 c.alpha = '(0.19 * (19.88-(V-Vhalfmn)) / (exp((19.88-(V-Vhalfmn))/10) - 1))'
 c.beta  = '(0.046*exp(-(V-Vhalfmn)/20.73))'
+c.infShift = c.tauShift = 'Vhalfmn'
 c.exponent = 2
 c.description = 'activation'
 c.name = 'c'
@@ -239,7 +262,7 @@ d.exponent = 1
 d.description = 'inactivation'
 d.name = 'd'
 
-CaN = VGCDynamicsBuilder()
+CaN = FusedVGCDynamicsBuilder()
 CaN.description = 'N type calcium channels'
 CaN.gates = [c, d]
 CaN.variable('Vhalfmn', 0, ' activation voltage shift')
@@ -251,11 +274,12 @@ CaN.name = 'CaN'
 e = Gate()
 e.alpha = '(15.69*(81.5-(V-Vhalfml))/(exp((81.5-(V-Vhalfml))/10)-1.0))'
 e.beta  = '(0.29*exp(-(V-Vhalfml)/10.86))'
+e.infShift = e.tauShift = 'Vhalfml'
 e.exponent = 2
 e.description = 'activation'
 e.name = 'e'
 
-CaL = VGCDynamicsBuilder()
+CaL = FusedVGCDynamicsBuilder()
 CaL.description = 'L type calcium channels'
 CaL.gates = [e]
 CaL.variable('Vhalfml', 0, ' activation voltage shift')
@@ -265,13 +289,17 @@ CaL.name = 'CaL'
 # Kbk #
 #######
 o = Gate()
-o.alpha = 'Ca*abar/(Ca + (k1*exp(-2*d1*FARADAY*V/R/(273.15 + celsius))))'
-o.beta  = 'bbar/(1 + Ca/(k2*exp(-2*d2*FARADAY*V/R/(273.15 + celsius))))'
+o.factors = [('e1', 'k1*exp(-2*d1*FARADAY*V/R/(273.15 + celsius))'),
+             ('e2', 'k2*exp(-2*d2*FARADAY*V/R/(273.15 + celsius))')]
+o.alpha = 'Ca*abar/(Ca + e1)'
+o.beta  = 'bbar/(1 + Ca/e2)'
+o.dV = 1
+o.Vmax = 60      # of the V x Ca table, worked out analytically above it
 o.exponent = 1
 o.description = 'activation'
 o.name = 'o'
 
-Kbk = VGCDynamicsBuilder()
+Kbk = FusedVGCDynamicsBuilder()
 Kbk.description = 'Ca and voltage activated BK channels'
 Kbk.gates = [o]
 Kbk.name = 'Kbk'
@@ -295,7 +323,7 @@ q.exponent = 2
 q.description = 'activation'
 q.name = 'q'
 
-Ksk = VGCDynamicsBuilder()
+Ksk = FusedVGCDynamicsBuilder()
 Ksk.description = 'Ca activated SK channels'
 Ksk.gates = [q]
 Ksk.name = 'Ksk'
@@ -0,0 +1,71 @@
+"""
+Background writer thread for the AP and trace handlers.
+
+The handlers copy what they need out of the cell and put a write on a
+bounded queue; a single thread does the formatting and file I/O in
+the order the writes were queued. When the queue is full the handler
+(and so the solver) waits for room, so memory use is bounded by the
+queue length. The time spent waiting is kept as a measure of how much
+the output holds up the run.
+
+An exception in a write is raised again in the solver thread at the
+next put, drain or close.
+"""
+
+import sys, threading, Queue
+from time import time
+
+
+class AsyncWriter(threading.Thread):
+    def __init__(self, maxsize=64):
+        threading.Thread.__init__(self, name='output writer')
+        self.setDaemon(True)
+        self.queue   = Queue.Queue(maxsize)
+        self.blocked = 0.       # seconds spent waiting on a full queue
+        self.waits   = 0        # number of puts that had to wait
+        self.puts    = 0
+        self.error   = None
+        self.start()
+
+    def _check(self):
+        if self.error:
+            (e, v, tb) = self.error
+            self.error = None
+            raise e, v, tb
+
+    def put(self, f, *args):
+        """Queue the call f(*args), waiting if the queue is full"""
+        self._check()
+        self.puts = self.puts + 1
+        try:
+            self.queue.put_nowait((f, args))
+        except Queue.Full:
+            start = time()
+            self.queue.put((f, args))
+            self.blocked = self.blocked + time() - start
+            self.waits = self.waits + 1
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            (f, args) = item
+            try:
+                f(*args)
+            except:
+                if not self.error:
+                    self.error = sys.exc_info()
+            self.queue.task_done()
+
+    def drain(self):
+        """Wait until every queued write is done"""
+        self.queue.join()
+        self._check()
+
+    def close(self):
+        """Finish the queued writes and stop the thread"""
+        self.queue.put(None)
+        self.join()
+        self._check()
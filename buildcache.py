@@ -0,0 +1,153 @@
+"""
+Content addressed cache of compiled C extensions.
+
+An extension is keyed by a hash of everything the compiled module
+depends on: the contents of its C sources, its macros, the compiler
+and its flags, the Python version and the parplex headers. When the
+key is in the cache the module is copied out of it and not compiled
+again; otherwise it is compiled with distutils, as before, and put in
+the cache. A generated extension (aradi.py's) can also be looked up by
+a recipe, the hash of the files and arguments that generate its source,
+so that an unchanged one is not even generated.
+
+The cache is a directory, shared by every checkout, sweep node and
+job that can see it, with one subdirectory per key. It is
+$P3BUILDCACHE, or ~/.p3buildcache.
+
+   python buildcache.py clear
+"""
+
+import sys, os, shutil
+from hashlib import sha1
+from distutils import sysconfig
+from runcache import fileDigest
+
+CACHEDIR = os.environ.get('P3BUILDCACHE',
+                          os.path.expanduser('~/.p3buildcache'))
+
+# compiler settings the built module depends on
+CONFIGVARS = ['CC', 'CFLAGS', 'CCSHARED', 'LDSHARED', 'OPT', 'SO']
+ENVVARS    = ['CC', 'CFLAGS', 'CPPFLAGS', 'LDFLAGS', 'LDSHARED']
+
+
+def headerDir():
+    return os.path.join(sysconfig.get_python_inc(), 'parplex')
+
+def pyfile(fn):
+    if fn[-4:] in ['.pyc', '.pyo']:
+        fn = fn[:-1]
+    return fn
+
+def hashBuild(h, name):
+    """Add the compiler, its flags and the headers to the hash h"""
+    h.update('%s %s %s\n' % (name, sys.version, sys.platform))
+    for v in CONFIGVARS:
+        h.update('config %s=%r\n' % (v, sysconfig.get_config_var(v)))
+    for v in ENVVARS:
+        h.update('env %s=%r\n' % (v, os.environ.get(v)))
+    d = headerDir()
+    if os.path.isdir(d):
+        for fn in sorted(os.listdir(d)):
+            if fn.endswith('.h'):
+                h.update('header %s=%s\n' %
+                         (fn, fileDigest(os.path.join(d, fn))))
+
+def buildKey(name, srcfiles, define_macros=[]):
+    """Cache key of the extension name built from srcfiles"""
+    h = sha1()
+    hashBuild(h, name)
+    for fn in srcfiles:
+        h.update('src %s=%s\n' % (os.path.basename(fn), fileDigest(fn)))
+    for m in define_macros:
+        h.update('macro %r\n' % (m,))
+    return h.hexdigest()
+
+def recipeKey(name, files, args):
+    """Recipe of the extension name generated by the Python files with
+    the arguments args"""
+    h = sha1()
+    hashBuild(h, name)
+    for fn in files:
+        h.update('gen %s=%s\n' % (os.path.basename(fn), fileDigest(pyfile(fn))))
+    h.update('args %r\n' % (list(args),))
+    return h.hexdigest()
+
+def copyOut(modfn, cached):
+    """Copy the cached module to modfn, if it is not that already"""
+    if os.path.exists(modfn) and fileDigest(modfn)==fileDigest(cached):
+        return
+    # a new file, not written over one a running process maps
+    tmp = '%s.%d' % (modfn, os.getpid())
+    shutil.copyfile(cached, tmp)
+    shutil.copymode(cached, tmp)
+    os.rename(tmp, modfn)
+
+def putFile(fn, data):
+    tmp = '%s.%d' % (fn, os.getpid())
+    f = open(tmp, 'wb')
+    f.write(data)
+    f.close()
+    os.rename(tmp, fn)
+
+def makedirs(d):
+    try:
+        os.makedirs(d)
+    except OSError:
+        # made by another build in the meantime
+        pass
+
+def fetchRecipe(name, recipe, cachedir=CACHEDIR):
+    """Copy out the extension name built before from recipe. Returns
+    False if there is none."""
+    fn = os.path.join(cachedir, 'recipes', recipe)
+    if not os.path.exists(fn):
+        return False
+    d = os.path.join(cachedir, open(fn).read().strip())
+    cached = os.path.join(d, name + sysconfig.get_config_var('SO'))
+    if not os.path.exists(cached):
+        return False
+    copyOut(name + sysconfig.get_config_var('SO'), cached)
+    os.utime(d, None)
+    print '%s is up to date (%s)' % (name + sysconfig.get_config_var('SO'), d)
+    return True
+
+def buildExtension(name, srcfiles, define_macros=[], recipe=None,
+                   cachedir=CACHEDIR):
+    """Build the extension name from srcfiles into the current
+    directory, from the cache if it has been built before. recipe is
+    remembered as making it."""
+    modfn = name + sysconfig.get_config_var('SO')
+    key = buildKey(name, srcfiles, define_macros)
+    d = os.path.join(cachedir, key)
+    cached = os.path.join(d, modfn)
+    if recipe:
+        makedirs(os.path.join(cachedir, 'recipes'))
+        putFile(os.path.join(cachedir, 'recipes', recipe), key + '\n')
+    if os.path.exists(cached):
+        copyOut(modfn, cached)
+        os.utime(d, None)
+        print '%s is up to date (%s)' % (modfn, d)
+        return
+
+    from distutils.core import setup, Extension
+    argv = sys.argv[:]
+    sys.argv[1:] = ['build_ext', '--inplace', '--force']
+    try:
+        setup(ext_modules=[Extension(name, srcfiles,
+                                     define_macros=define_macros)])
+    finally:
+        sys.argv[:] = argv
+
+    makedirs(d)
+    tmp = '%s.%d' % (cached, os.getpid())
+    shutil.copyfile(modfn, tmp)
+    shutil.copymode(modfn, tmp)
+    os.rename(tmp, cached)
+
+
+if __name__=='__main__':
+    if len(sys.argv)>1 and sys.argv[1]=='clear':
+        shutil.rmtree(CACHEDIR, True)
+    else:
+        print 'Usage: python buildcache.py clear'
+        sys.exit(1)
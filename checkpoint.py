@@ -0,0 +1,185 @@
+"""
+Checkpoints of the state of a network run.
+
+A Checkpointer saves, at the end of a window, everything needed to
+carry a run on from that time: the state vector and step size of every
+cell and the synaptic events still in flight. parplex keeps its event
+queues to itself, so the events are rebuilt from the APs of the last
+few windows (an AP at t reaches the target of a synapse at t plus its
+transmission time) and from the external input events still to come.
+
+   c = Checkpointer(Network, 'run.chk', every=200,
+                    inputs=nc_inputs(edges, Network))
+   gd.ap_handler = [ap_print, c.ap]
+   gd.endWindow_handler = [TimeTicker, c.endWindow]
+
+A run always starts at time 0, so a restored run is a run of the
+remaining time: restore loads the state of the network (which must be
+connected without its input events, see nc_edges) and queues the
+events relative to the checkpoint time, which it returns to be added
+to the times of the run's output. The solver picks its own first step,
+so the saved step sizes only seed it and a restored run does not
+repeat the original to the last digit. The channel parameters are not
+saved, so several variants can be carried on from one checkpoint.
+
+A checkpoint file is
+
+   8 bytes         magic 'P3CHKPT1'
+   header          time (float64), number of cells n, total number of
+                   state variables m, number of events k (uint32)
+   uint32[n]       length of the state vector of each cell
+   float64[n]      step size of each cell
+   float64[m]      the state vectors
+   EVENT_DTYPE[k]  the pending events
+
+all little endian. It is written to a temporary file and renamed, so a
+run that dies while writing keeps its previous checkpoint.
+"""
+
+import os, struct
+import numpy
+from p3 import message_print, info
+
+MAGIC = 'P3CHKPT1'
+HEADER = struct.Struct('<dIII')
+EVENT_DTYPE = numpy.dtype([('cell', '<i4'),
+                           ('synapse', '<i4'),
+                           ('time', '<f8'),
+                           ('strength', '<f8')])
+
+
+def outgoing(Network):
+    """The synapses of each cell, a dict of cell number: (target cells,
+    synlist indices, transmission times, strengths) arrays"""
+    index = {}
+    for (i, cell) in enumerate(Network):
+        for (k, dyn) in enumerate(cell.synlist):
+            index[id(dyn)] = (i, k)
+    out = {}
+    for (i, cell) in enumerate(Network):
+        syns = list(cell.soma.synapse)
+        if not syns: continue
+        tgt = [index[id(s.target_dynamics)] for s in syns]
+        out[i] = (numpy.array([c for (c, k) in tgt], dtype=numpy.int32),
+                  numpy.array([k for (c, k) in tgt], dtype=numpy.int32),
+                  numpy.array([s.trans_time for s in syns]),
+                  numpy.array([s.nominal_strength for s in syns]))
+    return out
+
+
+class Checkpointer:
+    def __init__(self, Network, fn, every=0, inputs=None, start=0.):
+        """Checkpoint to fn every so many ms (0 for only at the end
+        of the run) a run of Network starting at start. inputs are the
+        external input events, (cell, synapse, time, strength) arrays"""
+        self.Network = Network
+        self.fn      = fn
+        self.every   = every
+        self.start   = start
+        self.next    = start + every if every else None
+        if inputs is None:
+            inputs = (numpy.zeros(0, dtype=numpy.int32),)*2 + \
+                     (numpy.zeros(0),)*2
+        self.inputs  = [numpy.asarray(x) for x in inputs]
+        self.synapses = outgoing(Network)
+        delays = [d.max() for (c, k, d, w) in self.synapses.values()]
+        self.maxdelay = max(delays) if delays else 0.
+        self.spikes  = []        # (cellid, time) of the recent APs
+
+    def ap(self, cell):
+        """ap_handler keeping the APs that may still be in flight"""
+        if cell.id in self.synapses:
+            for t in cell.soma.APtimes:
+                self.spikes.append((cell.id, self.start + t))
+
+    def pending(self, t):
+        """The events arriving after t, an EVENT_DTYPE array"""
+        (cells, syns, times, strength) = self.inputs
+        later = times>t
+        parts = [(cells[later], syns[later], times[later], strength[later])]
+        for (cellid, ts) in self.spikes:
+            (tgt, k, delay, weight) = self.synapses[cellid]
+            later = ts + delay>t
+            parts.append((tgt[later], k[later], ts + delay[later],
+                          weight[later]))
+        n = sum([len(p[0]) for p in parts])
+        events = numpy.zeros(n, dtype=EVENT_DTYPE)
+        i = 0
+        for (tgt, k, times, strength) in parts:
+            j = i + len(tgt)
+            events['cell'][i:j] = tgt
+            events['synapse'][i:j] = k
+            events['time'][i:j] = times
+            events['strength'][i:j] = strength
+            i = j
+        return events
+
+    def endWindow(self, gd):
+        """endWindow_handler checkpointing when one is due"""
+        # the last window is clipped to the duration
+        t = min(self.start + (gd.windowID+1)*gd.window,
+                self.start + gd.duration)
+        self.spikes = [(c, ts) for (c, ts) in self.spikes
+                       if ts+self.maxdelay>t]
+        last = t>=self.start+gd.duration-1e-9
+        if last or (self.next is not None and t>=self.next-1e-9):
+            self.save(t)
+            if self.next is not None:
+                while self.next<=t+1e-9:
+                    self.next = self.next + self.every
+
+    def save(self, t):
+        """Write the state of the network at time t"""
+        Y = [numpy.array(list(cell.Y)) for cell in self.Network]
+        events = self.pending(t)
+        lengths = numpy.array([len(y) for y in Y], dtype='<u4')
+        tmp = '%s.%d' % (self.fn, os.getpid())
+        f = open(tmp, 'wb')
+        f.write(MAGIC)
+        f.write(HEADER.pack(t, len(Y), lengths.sum(), len(events)))
+        f.write(lengths.tostring())
+        f.write(numpy.array([cell.step for cell in self.Network],
+                            dtype='<f8').tostring())
+        f.write(numpy.concatenate(Y).astype('<f8').tostring())
+        f.write(events.tostring())
+        f.close()
+        os.rename(tmp, self.fn)
+        message_print(info, 'Checkpointed %d events at %gms to %s.\n'
+                      % (len(events), t, self.fn))
+
+
+def read(fn):
+    """Read a checkpoint. Returns (time, state vectors, steps, events)"""
+    f = open(fn, 'rb')
+    if f.read(len(MAGIC))!=MAGIC:
+        raise ValueError, '%s is not a checkpoint file' % fn
+    (t, n, m, k) = HEADER.unpack(f.read(HEADER.size))
+    lengths = numpy.fromfile(f, dtype='<u4', count=n)
+    steps = numpy.fromfile(f, dtype='<f8', count=n)
+    Y = numpy.fromfile(f, dtype='<f8', count=m)
+    events = numpy.fromfile(f, dtype=EVENT_DTYPE, count=k)
+    f.close()
+    if len(events)!=k:
+        raise ValueError, '%s is cut short' % fn
+    ends = numpy.cumsum(lengths)
+    return (t, numpy.split(Y, ends[:-1]), steps, events)
+
+def restore(Network, fn):
+    """Load the checkpoint fn into Network, connected without its
+    input events, and queue the pending events. Returns the
+    checkpoint time."""
+    (t, Y, steps, events) = read(fn)
+    if len(Y)!=len(Network):
+        raise ValueError, '%s is of a network of %d cells, not %d' % \
+              (fn, len(Y), len(Network))
+    for (i, (cell, y, step)) in enumerate(zip(Network, Y, steps.tolist())):
+        if len(cell.Y)!=len(y):
+            raise ValueError, '%s: %s %d has %d state variables, not %d' % \
+                  (fn, cell, i, len(cell.Y), len(y))
+        cell.Y[:] = y.tolist()
+        cell.step = step
+    for (c, k, time, strength) in events.tolist():
+        Network[c].synlist[k].enq(time-t, strength)
+    message_print(info, 'Restored %s at %gms with %d events.\n'
+                  % (fn, t, len(events)))
+    return t
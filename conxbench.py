@@ -0,0 +1,93 @@
+"""
+Construction time benchmark for the network connections.
+
+Builds the sprout_run.py network afresh for each method and times
+only the making of the connections:
+   script   - execfile of the literal nc_append script
+   per-edge - one nc_append call per row of the edge table
+   bulk     - one nc_append_many call for the whole edge table
+
+All three draw the GC->GC connections with the same seed, and the
+networks they make are checked to be the same.
+
+Usage: python conxbench.py [sprout [seed]]
+"""
+
+import sys, os, numpy
+
+from p3 import *
+from time import time
+from granule import *
+from edges import readEdges, convertScript
+
+set_message_option('nodebug')
+
+ngcell = 500
+nbcell = 6
+nmcell = 15
+nhcell = 6
+
+sprout = 1
+if len(sys.argv)>1:
+    sprout = float(sys.argv[1])
+seed = 0
+if len(sys.argv)>2:
+    seed = int(sys.argv[2])
+
+cnxscript = 'conx_sprout.py'
+cnxfn     = 'conx_sprout.edg'
+if not os.path.exists(cnxfn):
+    convertScript(cnxscript, cnxfn)
+
+def script(Network):
+    nc_script(cnxscript, Network, sprout, seed)
+
+def perEdge(Network):
+    (edges, typenames) = readEdges(cnxfn)
+    rng = numpy.random.RandomState(seed)
+    for e in edges.tolist():
+        nc_append(e[0], e[1], e[2], e[3], e[4], e[5], typenames[e[6]],
+                  Network=Network, sprout=sprout, ngcell=ngcell, rng=rng)
+
+def bulk(Network):
+    (edges, typenames) = readEdges(cnxfn)
+    nc_append_many(edges['src'], edges['tgt'], edges['synapse'],
+                   edges['weight'], edges['delay'], edges['threshold'],
+                   edges['type'], Network=Network, sprout=sprout, seed=seed)
+
+def connections(Network):
+    """The sorted (source, target, synapse, delay, strength) of every
+    connection made, to compare the networks of the methods"""
+    index = {}
+    for (i, c) in enumerate(Network):
+        for (j, dyn) in enumerate(c.synlist):
+            index[id(dyn)] = (i, j)
+    cnx = []
+    for (i, c) in enumerate(Network):
+        for s in c.soma.synapse:
+            cnx.append((i,) + index[id(s.target_dynamics)] +
+                       (s.trans_time, s.nominal_strength))
+    cnx.sort()
+    return cnx
+
+results = []
+made = []
+for (name, method) in [('script', script), ('per-edge', perEdge),
+                       ('bulk', bulk)]:
+    (Network, Ncmpt, Nstate) = makeNetwork(ngcell, nbcell, nmcell, nhcell,
+                                          useSlow=True)
+    start = time()
+    method(Network)
+    results.append((name, time()-start))
+    made.append(connections(Network))
+    del Network
+
+for (r, cnx) in zip(results[1:], made[1:]):
+    if cnx!=made[0]:
+        raise RuntimeError, '%s made a different network from %s' % \
+              (r[0], results[0][0])
+
+print 'Connection time for %d cells, sprout=%g, seed=%d, %d connections' % \
+      (ngcell+nbcell+nmcell+nhcell, sprout, seed, len(made[0]))
+for (name, t) in results:
+    print '  %-10s %8.3fs  %6.1fx' % (name, t, results[0][1]/t)
@@ -0,0 +1,173 @@
+"""
+Procedural generation of the Santhakumar et al (2005) dentate gyrus
+connectivity for any number of granule (GC), basket (BC), mossy (MC)
+and HIPP (HC) cells.
+
+The rules are those of conx_sprout.py, which was written for 500 GC,
+6 BC, 15 MC and 6 HC. The cells of each population lie on a ring
+and a presynaptic cell projects to the cells in the neighbourhood of
+its topographic position in the target population. The perforant
+path (PP) is a single external source with id one past the last cell.
+
+The result is an edge table (see edges.py) in the same order as the
+script: PP connections, then the connections of each GC in turn,
+then the BC->GC connections.
+
+Usage:
+   python conxgen.py ngcell nbcell nmcell nhcell edgefile [seed]
+"""
+
+import sys
+import numpy
+from edges import EDGE_DTYPE, CNXTYPES, writeEdges
+
+# Per connection type:
+#   fanout  - number of distinct targets of each presynaptic cell
+#   width   - number of neighbouring cells the targets are chosen from
+#             (a fraction of the target population if less than 1)
+#   copies  - number of times each connection is listed
+#   synapse - (first, last) target synapse index, chosen uniformly
+#   sided   - if set, the synapse is first for a target below the
+#             source on the ring and last for one above it, as in
+#             conx_sprout.py (chosen uniformly only for the source itself)
+RULES = {
+    'GC->BC': dict(fanout=1,  width=3,   copies=1, synapse=(2, 5),
+                   weight=4.7e-3, delay=0.8,  threshold=10),
+    'GC->MC': dict(fanout=1,  width=5,   copies=1, synapse=(4, 7),
+                   weight=2e-4,   delay=1.5,  threshold=10),
+    'GC->HC': dict(fanout=3,  width=5,   copies=1, synapse=(0, 3),
+                   weight=5e-4,   delay=1.5,  threshold=10),
+    # Sprouted mossy fibres, thinned by the sprout filter in nc_append
+    'GC->GC': dict(fanout=10, width=0.2, copies=2, synapse=(7, 8),
+                   sided=True, weight=2e-3, delay=0.8, threshold=10),
+    'BC->GC': dict(fanout=85, width=0.28, copies=1, synapse=(6, 6),
+                   weight=1.6e-3, delay=0.85, threshold=-10),
+    }
+
+# The PP drives the first fraction of each population through the
+# listed synapses, with one threshold per synapse
+PPRULES = {
+    'PP->GC': dict(fraction=0.2, synapses=(0, 1), thresholds=(10, 1),
+                   weight=0.02, delay=3),
+    'PP->BC': dict(fraction=1/3., synapses=(0, 1), thresholds=(10, 10),
+                   weight=0.01, delay=3),
+    }
+
+# Fraction of the basket cells with GC outputs (conx_sprout.py
+# only has those of the first of its six basket cells)
+BCGC_FRACTION = 1/6.
+
+
+def _width(rule, ntgt):
+    w = rule['width']
+    if w<1: w = int(round(w*ntgt)) | 1
+    return max(min(w, ntgt), rule['fanout'])
+
+def divergent(rng, nsrc, ntgt, tgt0, rule, centre=None):
+    """Targets and synapse indices, both nsrc x (fanout*copies), of a
+    population of nsrc cells projecting to ntgt cells numbered from
+    tgt0 with the topography given by rule."""
+    fanout = rule['fanout']
+    width  = _width(rule, ntgt)
+    if centre is None:
+        centre = numpy.arange(nsrc)*ntgt//nsrc
+    # choose fanout distinct neighbours of each cell's centre
+    if width<=4*fanout:
+        offset = numpy.argsort(rng.random_sample((nsrc, width)), axis=1)
+        offset = offset[:, :fanout]
+    else:
+        # redraw the rows with repeats until there are none
+        offset = rng.randint(0, width, size=(nsrc, fanout))
+        redo = numpy.arange(nsrc)
+        while len(redo):
+            s = numpy.sort(offset[redo], axis=1)
+            redo = redo[(s[:, 1:]==s[:, :-1]).any(axis=1)]
+            offset[redo] = rng.randint(0, width, size=(len(redo), fanout))
+    offset = offset - (width-1)//2
+    tgt = (centre[:, None] + offset) % ntgt + tgt0
+    (first, last) = rule['synapse']
+    syn = rng.randint(first, last+1, size=(nsrc, fanout))
+    if rule.get('sided'):
+        syn[offset<0] = first
+        syn[offset>0] = last
+    copies = rule['copies']
+    return (numpy.repeat(tgt, copies, axis=1),
+            numpy.repeat(syn, copies, axis=1))
+
+def _table(src, tgt, syn, cnxtype, weight, delay, threshold):
+    e = numpy.zeros(tgt.size, dtype=EDGE_DTYPE)
+    e['src']       = numpy.broadcast_to(src, tgt.shape).ravel()
+    e['tgt']       = tgt.ravel()
+    e['synapse']   = syn.ravel()
+    e['weight']    = weight
+    e['delay']     = delay
+    e['threshold'] = numpy.broadcast_to(threshold, tgt.shape).ravel()
+    e['type']      = CNXTYPES.index(cnxtype)
+    return e
+
+def makeEdges(ngcell, nbcell, nmcell, nhcell, seed=0,
+              rules=RULES, pprules=PPRULES, bcgc_fraction=BCGC_FRACTION):
+    """Generate the edge table for the network.
+    Returns (edges, typenames)"""
+    rng = numpy.random.RandomState(seed)
+    g0 = 0
+    b0 = g0 + ngcell
+    m0 = b0 + nbcell
+    h0 = m0 + nmcell
+    pp = h0 + nhcell
+    parts = []
+
+    # Perforant path
+    for (cnxtype, n, tgt0) in [('PP->GC', ngcell, g0),
+                               ('PP->BC', nbcell, b0)]:
+        r = pprules[cnxtype]
+        ntgt = int(r['fraction']*n + (cnxtype=='PP->GC'))
+        ntgt = min(ntgt, n)
+        nsyn = len(r['synapses'])
+        tgt = numpy.repeat(numpy.arange(ntgt) + tgt0, nsyn)
+        syn = numpy.tile(r['synapses'], ntgt)
+        thr = numpy.tile(r['thresholds'], ntgt)
+        parts.append(_table(pp, tgt, syn, cnxtype,
+                            r['weight'], r['delay'], thr))
+
+    # Granule cell outputs, listed GC by GC
+    gcparts = []
+    for (cnxtype, n, tgt0) in [('GC->BC', nbcell, b0),
+                               ('GC->MC', nmcell, m0),
+                               ('GC->HC', nhcell, h0),
+                               ('GC->GC', ngcell, g0)]:
+        if n==0: continue
+        r = rules[cnxtype]
+        (tgt, syn) = divergent(rng, ngcell, n, tgt0, r)
+        src = numpy.arange(ngcell)[:, None] + g0
+        gcparts.append(_table(src, tgt, syn, cnxtype,
+                              r['weight'], r['delay'], r['threshold']
+                              ).reshape(tgt.shape))
+    if gcparts:
+        parts.append(numpy.hstack(gcparts).ravel())
+
+    # Basket cell outputs
+    nbsrc = int(round(nbcell*bcgc_fraction))
+    if nbcell and ngcell and nbsrc:
+        r = rules['BC->GC']
+        centre = (2*numpy.arange(nbsrc)+1)*ngcell//(2*nbcell)
+        (tgt, syn) = divergent(rng, nbsrc, ngcell, g0, r, centre)
+        src = numpy.arange(nbsrc)[:, None] + b0
+        parts.append(_table(src, tgt, syn, 'BC->GC',
+                            r['weight'], r['delay'], r['threshold']))
+
+    return (numpy.concatenate(parts), list(CNXTYPES))
+
+
+if __name__=='__main__':
+    if len(sys.argv) not in [6, 7]:
+        print 'Usage: python conxgen.py ngcell nbcell nmcell nhcell ' \
+              'edgefile [seed]'
+        sys.exit(1)
+    (ngcell, nbcell, nmcell, nhcell) = [int(x) for x in sys.argv[1:5]]
+    seed = 0
+    if len(sys.argv)==7:
+        seed = int(sys.argv[6])
+    (edges, typenames) = makeEdges(ngcell, nbcell, nmcell, nhcell, seed)
+    writeEdges(sys.argv[5], edges, typenames)
+    print 'Wrote %d connections to %s' % (len(edges), sys.argv[5])
@@ -0,0 +1,131 @@
+"""
+Binary connectivity (edge table) files.
+
+An edge table holds one fixed size record per connection with the
+same fields as a call to granule.nc_append:
+
+   src, tgt, synapse, weight, delay, threshold, type
+
+where type is a small integer code into the list of connection type
+names stored in the file header. The records are stored packed and
+little endian after the header so that the table can be memory mapped
+straight into a numpy record array.
+
+File layout:
+   8 bytes        magic 'P3EDGES1'
+   uint32         number of edges
+   uint32         number of connection type names
+   16 bytes/name  NUL padded connection type names
+   padding        to an 8 byte boundary
+   records        EDGE_DTYPE
+
+Usage (one-time conversion of an nc_append script):
+   python edges.py conx_sprout.py conx_sprout.edg
+"""
+
+import sys, os, re, struct
+import numpy
+
+MAGIC = 'P3EDGES1'
+NAMELEN = 16
+
+EDGE_DTYPE = numpy.dtype([('src',       '<i4'),
+                          ('tgt',       '<i4'),
+                          ('synapse',   '<i4'),
+                          ('weight',    '<f8'),
+                          ('delay',     '<f8'),
+                          ('threshold', '<f8'),
+                          ('type',      'u1')])
+
+# Connection type names in the order they are coded
+CNXTYPES = ['PP->GC', 'PP->BC', 'GC->BC', 'GC->MC', 'GC->HC',
+            'GC->GC', 'BC->GC', '']
+
+
+def headerSize(ntypes):
+    n = len(MAGIC) + 8 + NAMELEN*ntypes
+    return (n+7)//8*8
+
+def typeCode(typenames, name):
+    """Code for connection type name, extending typenames if need be"""
+    try:
+        return typenames.index(name)
+    except ValueError:
+        if len(typenames)>255:
+            raise ValueError, 'too many connection types'
+        typenames.append(name)
+        return len(typenames)-1
+
+def writeEdges(fn, edges, typenames=CNXTYPES):
+    """Write the EDGE_DTYPE array edges to the file fn. The table is
+    written to a temporary file renamed to fn, so that a reader never
+    sees it half written."""
+    edges = numpy.asarray(edges, dtype=EDGE_DTYPE)
+    tmp = '%s.%d' % (fn, os.getpid())
+    f = open(tmp, 'wb')
+    f.write(struct.pack('<8sII', MAGIC, len(edges), len(typenames)))
+    for name in typenames:
+        if len(name)>=NAMELEN:
+            raise ValueError, 'connection type name %s is too long' % name
+        f.write(struct.pack('%ds' % NAMELEN, name))
+    f.write('\0'*(headerSize(len(typenames))-f.tell()))
+    f.write(edges.tostring())
+    f.close()
+    os.rename(tmp, fn)
+
+def readEdges(fn, mode='r'):
+    """Memory map the edge table in fn.
+    Returns (edges, typenames)"""
+    f = open(fn, 'rb')
+    (magic, nedges, ntypes) = struct.unpack('<8sII', f.read(16))
+    if magic!=MAGIC:
+        f.close()
+        raise IOError, '%s is not an edge table file' % fn
+    typenames = []
+    for i in range(ntypes):
+        typenames.append(f.read(NAMELEN).rstrip('\0'))
+    f.close()
+    if nedges==0:
+        return (numpy.zeros(0, dtype=EDGE_DTYPE), typenames)
+    edges = numpy.memmap(fn, dtype=EDGE_DTYPE, mode=mode,
+                         offset=headerSize(ntypes), shape=(nedges,))
+    return (edges, typenames)
+
+
+_ncexp = re.compile(r'^\s*nc_append\s*\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*,' +
+                    r'\s*([^,\s]+)\s*,\s*([^,\s]+)\s*,\s*([^,\s)]+)\s*' +
+                    r'(?:,\s*"([^"]*)"\s*)?\)')
+
+def parseScript(fn):
+    """Parse a script of literal nc_append(...) calls.
+    Returns (edges, typenames)"""
+    typenames = list(CNXTYPES)
+    rows = []
+    for l in open(fn):
+        o = _ncexp.match(l)
+        if not o: continue
+        (src, tgt, syn, w, d, th, name) = o.groups()
+        if name is None: name = ''
+        rows.append((int(src), int(tgt), int(syn),
+                     float(w), float(d), float(th),
+                     typeCode(typenames, name)))
+    return (numpy.array(rows, dtype=EDGE_DTYPE), typenames)
+
+def convertScript(scriptfn, edgefn):
+    """One-time conversion of an nc_append script into an edge table"""
+    (edges, typenames) = parseScript(scriptfn)
+    writeEdges(edgefn, edges, typenames)
+    return len(edges)
+
+
+if __name__=='__main__':
+    if len(sys.argv) not in [2, 3]:
+        print 'Usage: python edges.py script.py [edgefile]'
+        sys.exit(1)
+    scriptfn = sys.argv[1]
+    if len(sys.argv)==3:
+        edgefn = sys.argv[2]
+    else:
+        edgefn = re.sub(r'\.py$', '', scriptfn) + '.edg'
+    n = convertScript(scriptfn, edgefn)
+    print 'Wrote %d connections to %s' % (n, edgefn)
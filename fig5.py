@@ -1,18 +1,13 @@
 #!/usr/bin/python
 
-import sys, string, os
+from sweep import runSweep
 
-def writecmd(comment):
-    print 'Running: ', comment
-    os.system('python sprout_run.py %s\n' % comment)
-    
+points = []
 for sprout in [0.4, 0.5, 0.6, 0.7, 1]:
-    cmd = 'sprout=%g' % sprout
-    writecmd(cmd)
-    cmd = 'Vhalfmn=2 sprout=%g' % sprout
-    writecmd(cmd)
-    cmd = 'Vhalfm=-2 Vhalfmn=2 sprout=%g' % sprout
-    writecmd(cmd)
-    cmd = 'Vhalfm=-2 Vhalfns=2 Vhalfmn=2 sprout=%g' % sprout
-    writecmd(cmd)
+    points.append('sprout=%g' % sprout)
+    points.append('Vhalfmn=2 sprout=%g' % sprout)
+    points.append('Vhalfm=-2 Vhalfmn=2 sprout=%g' % sprout)
+    points.append('Vhalfm=-2 Vhalfns=2 Vhalfmn=2 sprout=%g' % sprout)
 
+if __name__=='__main__':
+    runSweep(points, resultdir='.', share=True)
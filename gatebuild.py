@@ -0,0 +1,736 @@
+"""
+Generating the channels of aradi.py with fused gate functions.
+
+p3Build's VGCDynamicsBuilder gives each gate separate inf and tau
+functions, and the VGC dynamics call both at every derivative
+evaluation and Hines update, so a gate defined by alpha and beta
+works out each of them twice. FusedVGCDynamicsBuilder writes one
+rates_<channel>_<gate> function per gate returning both, and derivs
+and HIupdate functions for the channel that call it.
+
+A gate with alpha and beta strings has them evaluated once into the
+locals alpha and beta. Its inf and tau are alpha/(alpha+beta) and
+1/(alpha+beta), or may be given as expressions of alpha, beta and
+the channel's variables:
+
+   h.alpha = '0.23/exp((V-Vhalfh+60+5)/20)'
+   h.beta  = '3.33/(exp(-(V-Vhalfh+60-47.5)/10.0)+1)'
+   h.tau   = 'Ah/(alpha+beta)'
+
+Gates with only inf and tau strings, or Python functions, are as in
+p3Build. The separate inf and tau functions are still made, for the
+rate methods (tau_h, h_inf, ...) of the channels.
+
+With tabulate set, on the channel or on a Gate of this module, the
+string gates of the channel are compiled into tables of inf and tau
+from Vmin to Vmax mV every dV, interpolated linearly and held at the
+end values outside them. The build prints the largest error of the
+interpolation, against the analytic form at 8 points in every step of
+the table, of each gate.
+
+A table is of V alone, but a gate may also use variables of the
+channel that only move it along the voltage axis or scale its tau:
+
+   n.infShift = n.tauShift = 'Vhalfn'   # inf(V-Vhalfn), tau(V-Vhalfn)
+   h.tauScale = 'Ah'                    # Ah*tau(V)
+
+The table is made with the shifts 0 and the scale 1, and is looked up
+at V less the shift, so every channel of a type shares one table
+whatever its mutation. The build checks that the variables act as
+declared. Gates using other variables are left analytic.
+
+A gate of V and Ca given by alpha and beta, such as the BK channel's,
+has its alpha and beta tabulated in two dimensions, over V and log Ca
+from CaMin to CaMax every dlogCa decades, as floats interpolated
+bilinearly, and worked out analytically outside the table. The rates
+are bounded where inf and tau may be very small or large, and an error
+e in them is at most 2e in the gate's derivative. The error of the
+interpolation in a cell is at most h**2/8 times the largest second
+derivative along each direction of step h, which is bounded by
+evaluating alpha and beta (of +, -, *, /, exp, log, sqrt and pow) in
+interval arithmetic over pieces of the cell. The steps are shrunk until
+this bound, with the rounding to floats, is within maxError (/ms), and
+the build fails if that takes more than MAXCATABLE entries.
+
+The factors of a gate that depend only on V can be given as named
+expressions, which are worked out once per call with the constants
+gathered where the compiler can fold them:
+
+   o.factors = [('e1', 'k1*exp(-2*d1*FARADAY*V/R/(273.15 + celsius))')]
+   o.alpha = 'Ca*abar/(Ca + e1)'
+"""
+
+import sys, os, re
+from math import log
+from cStringIO import StringIO
+import numpy
+import p3Build
+from p3Build import VGCDynamicsBuilder, DynamicsBuilder, fcnrewrite, \
+     makeGateFcns
+import buildcache
+
+
+class Gate(p3Build.Gate):
+    def __init__(self):
+        p3Build.Gate.__init__(self)
+        self.tabulate = None    # None for the channel's settings
+        self.Vmin = None
+        self.Vmax = None
+        self.dV   = None
+        self.infShift = None    # variables moving the gate along V
+        self.tauShift = None
+        self.tauScale = None    # and scaling its tau
+        self.factors = []       # (name, expression) of V only
+        self.CaMin = None
+        self.CaMax = None
+        self.dlogCa = None
+        self.maxError = None
+
+
+def setting(d, g, name):
+    """A table setting of gate g, or of channel d if g leaves it"""
+    x = getattr(g, name, None)
+    if x is None:
+        x = getattr(d, name)
+    return x
+
+def expressions(g):
+    factors = [e for (name, e) in getattr(g, 'factors', [])]
+    return factors + [e for e in [g.alpha, g.beta, g.inf, g.tau] if e]
+
+def dependencies(d, g):
+    """The variables of channel d, and Ca, that gate g depends on"""
+    names = [v.name for v in d.variables] + ['Ca']
+    return [n for n in names
+            if [e for e in expressions(g) if re.search(r'\b%s\b' % n, e)]]
+
+def transformVars(g):
+    return [x for x in [g.infShift, g.tauShift, g.tauScale] if x]
+
+def gateNamespace(d, g, V, values={}, Ca=0.):
+    """The names of the C expressions of gate g of channel d, with its
+    factors and alpha and beta worked out in numpy, at the voltages V
+    (and concentrations Ca). values are those of the channel's
+    variables that are not at their initial values."""
+    code = lambda s: fcnrewrite([], d.constants, s)
+    ns = {'exp': numpy.exp, 'log': numpy.log, 'sqrt': numpy.sqrt,
+          'pow': numpy.power, 'fabs': numpy.abs, 'V': V, 'Ca': Ca,
+          '_zero': 0*V + 0*Ca, '_code': code}
+    for v in d.variables:
+        ns[v.name] = float(values.get(v.name, v.init))
+    err = numpy.seterr(all='ignore')
+    try:
+        for (name, e) in getattr(g, 'factors', []):
+            ns[name] = eval(code(e), ns) + ns['_zero']
+        if g.alpha:
+            ns['alpha'] = eval(code(g.alpha), ns) + ns['_zero']
+            ns['beta']  = eval(code(g.beta), ns) + ns['_zero']
+    finally:
+        numpy.seterr(**err)
+    return ns
+
+def gateValues(d, g, V, values={}, Ca=0.):
+    """inf and tau of gate g of channel d, see gateNamespace"""
+    ns = gateNamespace(d, g, V, values, Ca)
+    (code, zero) = (ns['_code'], ns['_zero'])
+    err = numpy.seterr(all='ignore')
+    try:
+        if g.alpha:
+            inf = eval(code(g.inf or 'alpha/(alpha+beta)'), ns) + zero
+            tau = eval(code(g.tau or '1/(alpha+beta)'), ns) + zero
+        else:
+            inf = eval(code(g.inf), ns) + zero
+            tau = eval(code(g.tau), ns) + zero
+    finally:
+        numpy.seterr(**err)
+    return (inf, tau)
+
+def tableValues(d, g, V, values={}, Ca=0.):
+    """gateValues with the removable singularities (0/0 at a point of
+    some alpha functions) filled in from either side"""
+    (inf, tau) = gateValues(d, g, V, values, Ca)
+    bad = ~(numpy.isfinite(inf) & numpy.isfinite(tau))
+    if bad.any():
+        (V, Ca) = [x[bad] for x in numpy.broadcast_arrays(V, Ca, inf)[:2]]
+        eps = 1e-6*(1 + abs(V))
+        (inf0, tau0) = gateValues(d, g, V-eps, values, Ca)
+        (inf1, tau1) = gateValues(d, g, V+eps, values, Ca)
+        inf[bad] = (inf0+inf1)/2
+        tau[bad] = (tau0+tau1)/2
+    return (inf, tau)
+
+def baseValues(g):
+    """The values of the shift and scale variables of the table"""
+    values = {}
+    for x in [g.infShift, g.tauShift]:
+        if x: values[x] = 0.
+    if g.tauScale:
+        values[g.tauScale] = 1.
+    return values
+
+def checkTransforms(d, g):
+    """Whether the shift and scale variables of gate g act as declared,
+    by comparing the gate with them changed to the shifted and scaled
+    table values"""
+    V = numpy.arange(-90, 90, 0.37)
+    base = baseValues(g)
+    values = {}
+    for (x, change) in [(g.infShift, 3.1), (g.tauShift, 3.1),
+                        (g.tauScale, 1.7)]:
+        if x: values[x] = base[x] + change
+    (inf, tau) = tableValues(d, g, V, values)
+    infShift = values.get(g.infShift, 0.)
+    tauShift = values.get(g.tauShift, 0.)
+    scale = values.get(g.tauScale, 1.)
+    inf0 = tableValues(d, g, V - infShift, base)[0]
+    tau0 = scale*tableValues(d, g, V - tauShift, base)[1]
+    return numpy.allclose(inf, inf0, rtol=1e-8, atol=1e-12) and \
+           numpy.allclose(tau, tau0, rtol=1e-8, atol=1e-12)
+
+def makeTable(d, g):
+    """The table and lookup function of gate g of channel d and the
+    body of its rates function. Prints the largest interpolation
+    errors."""
+    name = '%s_%s' % (d.name, g.name)
+    Vmin = float(setting(d, g, 'Vmin'))
+    Vmax = float(setting(d, g, 'Vmax'))
+    dV   = float(setting(d, g, 'dV'))
+    n = int(round((Vmax-Vmin)/dV)) + 1
+    V = Vmin + dV*numpy.arange(n)
+    base = baseValues(g)
+    (inf, tau) = tableValues(d, g, V, base)
+
+    # error at points between those of the table
+    sub = 8
+    Vs = Vmin + dV*numpy.arange((n-1)*sub)/sub
+    (infs, taus) = tableValues(d, g, Vs, base)
+    infErr = abs(numpy.interp(Vs, V, inf) - infs).max()
+    tauErr = (abs(numpy.interp(Vs, V, tau) - taus)/abs(taus)).max()
+    print '%s %s: tabulated %g..%gmV by %g, largest error inf %.2g, ' \
+          'tau %.2g (relative)' % (d.name, g.name, Vmin, V[-1], dV,
+                                   infErr, tauErr)
+
+    rows = ',\n'.join(['{%.17g, %.17g}' % x for x in zip(inf, tau)])
+    table = 'static const double table_%s[%d][2] = {\n%s\n};\n\n' % \
+            (name, n, rows)
+    table = table + \
+           'static void lookup_%s(double V, double *inf, double *tau) {\n' \
+           % name + \
+           '   const double (*x)[2] = table_%s;\n' % name + \
+           '   double f;\n' + \
+           '   int i;\n\n' + \
+           '   if( V<=%.17g ) {*inf = x[0][0]; *tau = x[0][1]; return;}\n' \
+           % Vmin + \
+           '   f = (V-(%.17g))*%.17g;\n' % (Vmin, 1/dV) + \
+           '   i = (int)f;\n' + \
+           '   if( i>=%d ) {*inf = x[%d][0]; *tau = x[%d][1]; return;}\n' \
+           % (n-1, n-1, n-1) + \
+           '   f -= i;\n' + \
+           '   *inf = x[i][0] + f*(x[i+1][0]-x[i][0]);\n' + \
+           '   *tau = x[i][1] + f*(x[i+1][1]-x[i][1]);\n}\n\n'
+
+    at = lambda x: x and 'V - self->%s' % x or 'V'
+    if g.infShift==g.tauShift:
+        body = '   lookup_%s(%s, inf, tau);\n' % (name, at(g.infShift))
+    else:
+        body = '   double x;\n' + \
+               '   lookup_%s(%s, inf, &x);\n' % (name, at(g.infShift)) + \
+               '   lookup_%s(%s, &x, tau);\n' % (name, at(g.tauShift))
+    if g.tauScale:
+        body = body + '   *tau *= self->%s;\n' % g.tauScale
+    return (table, body)
+
+
+MAXCATABLE = 1<<16     # entries of a 2D table
+
+class Interval:
+    """The intervals [lo, hi] of arrays lo and hi, with the results of
+    arithmetic on them rounded outward"""
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+
+    def __add__(self, x):
+        x = interval(x)
+        return rounded(self.lo + x.lo, self.hi + x.hi)
+    __radd__ = __add__
+
+    def __neg__(self):
+        return Interval(-self.hi, -self.lo)
+
+    def __sub__(self, x):
+        return self + -interval(x)
+
+    def __rsub__(self, x):
+        return interval(x) - self
+
+    def __mul__(self, x):
+        x = interval(x)
+        p = [self.lo*x.lo, self.lo*x.hi, self.hi*x.lo, self.hi*x.hi]
+        return rounded(reduce(numpy.minimum, p), reduce(numpy.maximum, p))
+    __rmul__ = __mul__
+
+    def recip(self):
+        ok = (self.lo>0) | (self.hi<0)
+        return rounded(numpy.where(ok, 1/self.hi, -numpy.inf),
+                       numpy.where(ok, 1/self.lo, numpy.inf))
+
+    def sq(self):
+        (a, b) = (self.lo**2, self.hi**2)
+        zero = (self.lo<=0) & (self.hi>=0)
+        return rounded(numpy.where(zero, 0., numpy.minimum(a, b)),
+                       numpy.maximum(a, b))
+
+    def exp(self):
+        return rounded(numpy.exp(self.lo), numpy.exp(self.hi))
+
+    def log(self):
+        return rounded(numpy.log(self.lo), numpy.log(self.hi))
+
+    def sqrt(self):
+        return rounded(numpy.sqrt(self.lo), numpy.sqrt(self.hi))
+
+    def mag(self):
+        return numpy.maximum(abs(self.lo), abs(self.hi))
+
+def rounded(lo, hi):
+    """Interval(lo, hi) widened by an ulp either way, or the whole line
+    where it is undefined"""
+    bad = numpy.isnan(lo) | numpy.isnan(hi)
+    return Interval(numpy.where(bad, -numpy.inf,
+                                numpy.nextafter(lo, -numpy.inf)),
+                    numpy.where(bad, numpy.inf,
+                                numpy.nextafter(hi, numpy.inf)))
+
+def interval(x):
+    if isinstance(x, Interval): return x
+    return Interval(x, x)
+
+class Jet:
+    """A function along one direction over intervals: bounds on its
+    value and its first and second derivatives"""
+    def __init__(self, v, d=0., dd=0.):
+        self.v = interval(v)
+        self.d = interval(d)
+        self.dd = interval(dd)
+
+    def __add__(self, x):
+        x = jet(x)
+        return Jet(self.v + x.v, self.d + x.d, self.dd + x.dd)
+    __radd__ = __add__
+
+    def __neg__(self):
+        return Jet(-self.v, -self.d, -self.dd)
+
+    def __sub__(self, x):
+        return self + -jet(x)
+
+    def __rsub__(self, x):
+        return jet(x) - self
+
+    def __mul__(self, x):
+        x = jet(x)
+        return Jet(self.v*x.v, self.d*x.v + self.v*x.d,
+                   self.dd*x.v + 2*(self.d*x.d) + self.v*x.dd)
+    __rmul__ = __mul__
+
+    def recip(self):
+        r = self.v.recip()
+        r2 = r.sq()
+        return Jet(r, -(self.d*r2), (2*(self.d.sq()*r) - self.dd)*r2)
+
+    def __div__(self, x):
+        return self*jet(x).recip()
+    __truediv__ = __div__
+
+    def __rdiv__(self, x):
+        return jet(x)*self.recip()
+    __rtruediv__ = __rdiv__
+
+def jet(x):
+    if isinstance(x, Jet): return x
+    return Jet(x)
+
+def jetExp(x):
+    x = jet(x)
+    e = x.v.exp()
+    return Jet(e, e*x.d, e*(x.dd + x.d.sq()))
+
+def jetLog(x):
+    x = jet(x)
+    r = x.v.recip()
+    return Jet(x.v.log(), x.d*r, (x.dd - x.d.sq()*r)*r)
+
+def jetSqrt(x):
+    x = jet(x)
+    s = x.v.sqrt()
+    r = (2*s).recip()
+    return Jet(s, x.d*r, (x.dd - 0.5*(x.d.sq()*x.v.recip()))*r)
+
+def jetPow(x, y):
+    return jetExp(y*jetLog(x))
+
+def rateJets(d, g, V, Ca):
+    """alpha and beta of gate g of channel d as Jets, for V and Ca
+    Jets along the same direction"""
+    code = lambda s: fcnrewrite([], d.constants, s)
+    ns = {'exp': jetExp, 'log': jetLog, 'sqrt': jetSqrt, 'pow': jetPow,
+          'V': V, 'Ca': Ca}
+    for (name, e) in getattr(g, 'factors', []):
+        ns[name] = eval(code(e), ns)
+    return (jet(eval(code(g.alpha), ns)), jet(eval(code(g.beta), ns)))
+
+def subIntervals(x, sub, between):
+    """The intervals of sub pieces of each step of the grid x, the
+    points between two grid points being given by between(x0, x1, f)"""
+    f = numpy.arange(sub+1)/float(sub)
+    edges = between(x[:-1,None], x[1:,None], f[None,:])
+    (edges[:,0], edges[:,-1]) = (x[:-1], x[1:])
+    return rounded(edges[:,:-1].ravel(), edges[:,1:].ravel())
+
+def CaTableBound(d, g, V, Ca, alpha, beta, sub=4):
+    """Bounds on the error of the bilinear interpolation of the float
+    2D tables alpha and beta at V x Ca (Ca in steps of equal log),
+    along V, along log Ca and overall. The error in a cell is at most
+    h**2/8 times the largest second derivative along each direction of
+    step h, which is bounded by Jets over sub x sub pieces of the
+    cell."""
+    (hV, hu) = (V[1]-V[0], log(Ca[1]/Ca[0]))
+    Vs = subIntervals(V, sub, lambda a, b, f: a + f*(b-a))
+    Cas = subIntervals(Ca, sub, lambda a, b, f: a*(b/a)**f)
+    Vs = Interval(Vs.lo[:,None], Vs.hi[:,None])
+    Cas = Interval(Cas.lo[None,:], Cas.hi[None,:])
+    err = numpy.seterr(all='ignore')
+    try:
+        alongV = rateJets(d, g, Jet(Vs, 1.), Jet(Cas))
+        alongCa = rateJets(d, g, Jet(Vs), Jet(Cas, Cas, Cas))
+    finally:
+        numpy.seterr(**err)
+    # the largest of the pieces of each cell
+    zero = numpy.zeros(((len(V)-1)*sub, (len(Ca)-1)*sub))
+    cells = lambda x: (x + zero).reshape(len(V)-1, sub, len(Ca)-1,
+                                         sub).max(3).max(1)
+    (errV, errCa, errs) = (0., 0., 0.)
+    for (x, jV, jCa) in zip([alpha, beta], alongV, alongCa):
+        eV = hV**2/8.*cells(jV.dd.mag())
+        eCa = hu**2/8.*cells(jCa.dd.mag())
+        # the table values rounded to floats, and the arithmetic
+        x = abs(x)
+        corner = numpy.maximum(numpy.maximum(x[:-1,:-1], x[:-1,1:]),
+                               numpy.maximum(x[1:,:-1], x[1:,1:]))
+        e = eV + eCa + 2.**-23*corner
+        (errV, errCa) = (max(errV, eV.max()), max(errCa, eCa.max()))
+        errs = max(errs, e.max())
+    return (errV, errCa, errs)
+
+def makeCaTable(d, g):
+    """The 2D tables and lookup function of alpha and beta of gate g of
+    channel d, over V and log Ca, and the body of its rates function,
+    which works them out analytically outside the table. Prints the
+    error bound, and raises ValueError if no table within MAXCATABLE
+    entries meets maxError."""
+    name = '%s_%s' % (d.name, g.name)
+    Vmin = float(setting(d, g, 'Vmin'))
+    Vmax = float(setting(d, g, 'Vmax'))
+    dV   = float(setting(d, g, 'dV'))
+    CaMin = float(setting(d, g, 'CaMin'))
+    CaMax = float(setting(d, g, 'CaMax'))
+    dlogCa = float(setting(d, g, 'dlogCa'))
+    maxError = float(setting(d, g, 'maxError'))
+    while True:
+        nV = int(round((Vmax-Vmin)/dV)) + 1
+        nCa = int(round(numpy.log10(CaMax/CaMin)/dlogCa)) + 1
+        if nV*nCa>MAXCATABLE:
+            raise ValueError, '%s %s: no table of %d entries or less is ' \
+                  'within %g/ms' % (d.name, g.name, MAXCATABLE, maxError)
+        V = Vmin + dV*numpy.arange(nV)
+        Ca = CaMin*10**(dlogCa*numpy.arange(nCa))
+        ns = gateNamespace(d, g, V[:,None], {}, Ca[None,:])
+        (alpha, beta) = (ns['alpha'], ns['beta'])
+        (errV, errCa, err) = CaTableBound(d, g, V, Ca, alpha, beta)
+        if err<=maxError: break
+        # the error goes as the step squared, but its bound is looser
+        # on larger steps, so they are at most halved at a time
+        shrink = lambda e: max(0.5, 0.95*(maxError/2/e)**0.5)
+        if errV>maxError/2:
+            dV = dV*shrink(errV)
+        if errCa>maxError/2:
+            dlogCa = dlogCa*shrink(errCa)
+    print '%s %s: tabulated %g..%gmV by %g and %g..%gmM by %g decades ' \
+          '(%d entries), error of the rates at most %.2g/ms' % \
+          (d.name, g.name, Vmin, V[-1], dV, CaMin, Ca[-1], dlogCa,
+           nV*nCa, err)
+
+    f32 = lambda x: '%.9g' % numpy.float32(x)
+    rows = ',\n'.join(['{%s, %s}' % (f32(a), f32(b))
+                       for (a, b) in zip(alpha.ravel(), beta.ravel())])
+    table = 'static const float table_%s[%d][2] = {\n%s\n};\n\n' % \
+            (name, nV*nCa, rows)
+    table = table + \
+           'static int lookup_%s(double V, double Ca, ' \
+           'double *alpha, double *beta) {\n' % name + \
+           '   const float (*x)[2];\n' + \
+           '   double f, c;\n' + \
+           '   int i, j;\n\n' + \
+           '   if( !(V>=%.17g && V<=%.17g && Ca>=%.17g && Ca<=%.17g) )\n' \
+           % (Vmin, V[-1], CaMin, Ca[-1]) + \
+           '      return 0;\n' + \
+           '   f = (V-(%.17g))*%.17g;\n' % (Vmin, 1/dV) + \
+           '   i = (int)f;\n' + \
+           '   if( i>%d ) i = %d;\n' % (nV-2, nV-2) + \
+           '   f -= i;\n' + \
+           '   c = (log(Ca)-(%.17g))*%.17g;\n' % \
+           (log(CaMin), 1/(dlogCa*log(10))) + \
+           '   j = (int)c;\n' + \
+           '   if( j>%d ) j = %d;\n' % (nCa-2, nCa-2) + \
+           '   c -= j;\n' + \
+           '   x = table_%s + i*%d + j;\n' % (name, nCa) + \
+           '   *alpha = (1-f)*((1-c)*x[0][0] + c*x[1][0]) + \n' + \
+           '            f*((1-c)*x[%d][0] + c*x[%d][0]);\n' % (nCa, nCa+1) + \
+           '   *beta  = (1-f)*((1-c)*x[0][1] + c*x[1][1]) + \n' + \
+           '            f*((1-c)*x[%d][1] + c*x[%d][1]);\n' % \
+           (nCa, nCa+1) + \
+           '   return 1;\n}\n\n'
+    code = lambda s: fcnrewrite(d.variables, d.constants, s)
+    body = '   double alpha, beta;\n' + \
+           '   if( !lookup_%s(V, Ca, &alpha, &beta) ) {\n' % name
+    for (factor, e) in getattr(g, 'factors', []):
+        body = body + '      double %s = %s;\n' % (factor, code(e))
+    body = body + '      alpha = %s;\n' % code(g.alpha) + \
+           '      beta  = %s;\n' % code(g.beta) + \
+           '   }\n' + \
+           '   *tau = 1/(alpha+beta);\n' + \
+           '   *inf = alpha*(*tau);\n'
+    return (table, body)
+
+
+def makeRatesFcn(d, g):
+    """The C functions of gate g of channel d: rates_, inf_ and tau_"""
+    name = '%s_%s' % (d.name, g.name)
+    rates = 'static void rates_%s(%s *self, double V, double Ca,\n' % \
+            (name, d.name)
+    rates = rates + ' '*len('static void rates_%s(' % name) + \
+            'double *inf, double *tau) {\n'
+    code = lambda s: fcnrewrite(d.variables, d.constants, s)
+
+    if callable(g.alpha) or callable(g.tau):
+        # table functions, which the rates function looks up
+        (tau, inf) = makeGateFcns(d, g)
+        rates = rates + '   *inf = inf_%s(self, V, Ca);\n' % name + \
+                '   *tau = tau_%s(self, V, Ca);\n}\n\n' % name
+        return inf + tau + rates
+
+    tabulate = setting(d, g, 'tabulate')
+    table = None
+    if tabulate:
+        deps = dependencies(d, g)
+        others = [x for x in deps if x not in transformVars(g) + ['Ca']]
+        usesV = [e for e in expressions(g) if re.search(r'\bV\b', e)]
+        if others:
+            print '%s %s: depends on %s, not tabulated' % \
+                  (d.name, g.name, ', '.join(others))
+        elif 'Ca' in deps and (transformVars(g) or not usesV or
+                               not g.alpha or g.inf or g.tau):
+            print '%s %s: only alpha and beta gates of V and Ca, with no ' \
+                  'shifts, are tabulated with Ca' % (d.name, g.name)
+        elif 'Ca' in deps:
+            table = makeCaTable(d, g)
+        elif not checkTransforms(d, g):
+            print '%s %s: %s do not act as declared, not tabulated' % \
+                  (d.name, g.name, ', '.join(transformVars(g)))
+        else:
+            table = makeTable(d, g)
+
+    if table:
+        rates = table[0] + rates + table[1] + '}\n\n'
+    else:
+        for (factor, e) in getattr(g, 'factors', []):
+            rates = rates + '   double %s = %s;\n' % (factor, code(e))
+        if g.alpha:
+            rates = rates + '   double alpha = %s;\n' % code(g.alpha) + \
+                    '   double beta  = %s;\n' % code(g.beta) + \
+                    '   *inf = %s;\n' % code(g.inf or 'alpha/(alpha+beta)') + \
+                    '   *tau = %s;\n}\n\n' % code(g.tau or '1/(alpha+beta)')
+        else:
+            rates = rates + '   *inf = %s;\n' % code(g.inf) + \
+                    '   *tau = %s;\n}\n\n' % code(g.tau)
+    fstr = 'static double %s_%s(%s *self, double V, double Ca) {\n' \
+           '   double inf, tau;\n' \
+           '   rates_%s(self, V, Ca, &inf, &tau);\n' \
+           '   return %s;\n}\n'
+    return rates + fstr % ('inf', name, d.name, name, 'inf') + \
+           fstr % ('tau', name, d.name, name, 'tau') + '\n'
+
+
+class FusedVGCDynamicsBuilder(VGCDynamicsBuilder):
+    tabulate = False
+    Vmin = -100
+    Vmax = 100
+    dV   = 0.1
+    CaMin = 1e-6        # mM
+    CaMax = 0.1
+    dlogCa = 0.1
+    maxError = 1e-4
+
+    def gateFcns(self):
+        return ''.join([makeRatesFcn(self, g) for g in self.gates])
+
+    def updateFcns(self):
+        """derivs and HIupdate functions of the channel, as those of
+        the VGC dynamics but calling the rates functions"""
+        head = '   double V = GETEM_DYN(self, t);\n' \
+               '   double Ca = self->Cadynamics ? ' \
+               'GETSTATE_DYN(self->Cadynamics, 0) : 0;\n' \
+               '   double inf, tau, x;\n\n'
+        derivs = 'static void derivs_%s(%s *self, double t) {\n' % \
+                 (self.name, self.name) + head
+        update = 'static void HIupdate_%s(%s *self, double t, double h) {\n' % \
+                 (self.name, self.name) + head
+        for (i, g) in enumerate(self.gates):
+            rates = '   rates_%s_%s(self, V, Ca, &inf, &tau);\n' % \
+                    (self.name, g.name)
+            derivs = derivs + rates + \
+                     '   x = GETSTATE_DYN(self, %d);\n' % i + \
+                     '   SETDERIV_DYN(self, %d, (inf - x) / tau);\n' % i
+            update = update + rates + \
+                     '   x = GETSTATE_DYN(self, %d);\n' % i + \
+                     '   SETSTATE_DYN(self, %d, ' \
+                     '(2*h*inf - h*x + 2*tau*x) / (h + 2*tau));\n' % i
+        return derivs + '}\n\n' + update + '}\n\n'
+
+    def writer(self, modf):
+        sep = ''
+        stateVars = ''
+        derivVars = ''
+        traceVars = ''
+        exponents = ''
+        expNames= ''
+        tauFcnList = ''
+        tauNameList = ''
+        infFcnList = ''
+        infNameList = ''
+        for g in self.gates:
+            stateVars   = stateVars   + sep + '"' + g.name + '"'
+            derivVars   = derivVars   + sep + '"d' + g.name + 'dt"'
+            traceVars   = traceVars   + sep + '"' + g.name + 'Trace"'
+            exponents   = exponents   + sep + str(g.exponent)
+            expNames    = expNames    + sep + '"' + g.name + 'exp"'
+            tauFcnList  = tauFcnList  + sep + '(gatefcn*)tau_' + self.name + \
+                         '_' + g.name
+            infFcnList  = infFcnList  + sep + '(gatefcn*)inf_' + self.name + \
+                         '_' + g.name
+            tauNameList = tauNameList + sep + '"tau_' + g.name + '"'
+            infNameList = infNameList + sep + '"' + g.name + '_inf"'
+            sep = ', '
+
+        memberdef = 'static PyMemberDef %s_members[] = {\n' % self.name
+        struct    = 'typedef struct {\n   VGCDYNAMICS\n'
+        for v in self.variables:
+            memberdef = memberdef + '{"' + v.name + '", T_DOUBLE, offsetof(' + \
+            self.name + ', ' + v.name + '), 0, "' + v.description + '"},\n'
+            struct = struct + '   double ' + v.name + ';\n'
+        memberdef = memberdef + '{NULL}\n};\n\n'
+        struct = struct + '}  %s;\n\n' % self.name
+
+        # The VGC initialiser sets its own derivs and HIupdate before
+        # calling this one
+        init = 'static int init%s(%s *self) {\n' % (self.name, self.name)
+        for v in self.variables:
+            init = init + '   self->%s=%g;\n' % (v.name, v.init)
+        init = init + '   self->derivs   = (derivsfcn*)derivs_%s;\n' % self.name
+        init = init + '   self->HIupdate = (HIupdatefcn*)HIupdate_%s;\n' % \
+                      self.name
+        init = init + '   return 0;\n}\n\n'
+
+        modf.write(struct)
+        modf.write(self.gateFcns())
+        modf.write(self.updateFcns())
+        modf.write(init)
+        modf.write(memberdef)
+        n = self.name
+        modf.write('static char *%sStateVars[] = {%s};\n'    % (n, stateVars))
+        modf.write('static char *%sDerivVars[] = {%s};\n'    % (n, derivVars))
+        modf.write('static char *%sTraceVars[] = {%s};\n'    % (n, traceVars))
+        modf.write('static int   %sexponents[] = {%s};\n'    % (n, exponents))
+        modf.write('static char *%sexponentNames[] = {%s};\n' % (n, expNames))
+        modf.write('static gatefcn *%stau[] = {%s};\n'       % (n, tauFcnList))
+        modf.write('static char *%stauNames[] = {%s};\n'     % (n, tauNameList))
+        modf.write('static gatefcn *%sinf[] = {%s};\n'       % (n, infFcnList))
+        modf.write('static char *%sinfNames[] = {%s};\n\n'   % (n, infNameList))
+        modf.write('DynamicsDescriptor %sDescriptor = {\n' % self.name)
+        modf.write('    "%s",\n' % self.name)
+        modf.write('    "%s",\n' % self.description)
+        modf.write('    %s_members,\n' % self.name)
+        modf.write('    0,\n')
+        modf.write('    %d,\n' % len(self.gates))
+        modf.write('    %sStateVars,\n' % self.name)
+        modf.write('    %sDerivVars,\n' % self.name)
+        modf.write('    %sTraceVars,\n' % self.name)
+        modf.write('    0,\n')
+        modf.write('    0,\n')
+        modf.write('    0,\n')
+        modf.write('    0,\n')
+        modf.write('    0,\n')
+        modf.write('    sizeof(%s),\n' % self.name)
+        modf.write('    0,\n')
+        modf.write('    (userinitfcn*)init%s,\n' % self.name)
+        modf.write('    &%sexponents[0],\n' % self.name)
+        modf.write('    %sexponentNames,\n' % self.name)
+        modf.write('    %stau,\n' % self.name)
+        modf.write('    %stauNames,\n' % self.name)
+        modf.write('    %sinf,\n' % self.name)
+        modf.write('    %sinfNames,\n' % self.name)
+        modf.write('    %s,\n' % self.type)
+        modf.write('    0\n')
+        modf.write('};\n')
+        modf.write('REGISTER_VGC_DESCRIPTOR(%sDescriptor)\n\n' % self.name)
+
+
+TABLESETTINGS = ['tabulate', 'Vmin', 'Vmax', 'dV', 'CaMin', 'CaMax',
+                 'dlogCa', 'maxError']
+
+def tableSettings(x):
+    return [(k, getattr(x, k, None)) for k in TABLESETTINGS]
+
+def build(modname, moddescription):
+    """p3Build's build, but through the build cache (see buildcache):
+    nothing is done if the script calling it, this module, p3Build and
+    the table settings of the channels are those of a cached build, and
+    modname.c is left alone if the code is the same"""
+    # the generator is the caller, which need not be __main__: aradi.py
+    # is also run by the import of a missing aradi extension
+    generator = sys._getframe(1).f_globals['__file__']
+    settings = []
+    for d in DynamicsBuilder.DynamicsList:
+        gates = getattr(d, 'gates', [])
+        settings.append((d.name, tableSettings(d),
+                         [tableSettings(g) for g in gates]))
+    recipe = buildcache.recipeKey(modname, [generator, __file__,
+                                            p3Build.__file__],
+                                  [moddescription, settings])
+    if buildcache.fetchRecipe(modname, recipe):
+        return
+
+    modf = StringIO()
+    modf.write('#include <parplex/ndl.h>\n\n')
+
+    dlist1 = ''
+    dlist2 = ''
+    for d in DynamicsBuilder.DynamicsList:
+        d.writer(modf)
+        dlist1 = dlist1 + '&' + d.name + 'Descriptor,\n'
+        dlist2 = dlist2 + 'init' + d.name + 'Descriptor,\n'
+
+    modf.write('static DynamicsDescriptor *userDynamics[] = {\n%s};\n\n' %
+               dlist1)
+    modf.write('static initproc LuserInitDynamics[] = {\n%s};\n\n' % dlist2)
+
+    modf.write('MAKE_P3_MODEL(%s, "%s")\n' % (modname, moddescription))
+
+    code = modf.getvalue()
+    fn = modname + '.c'
+    if not os.path.exists(fn) or open(fn).read()!=code:
+        f = open(fn, 'w')
+        f.write(code)
+        f.close()
+    buildcache.buildExtension(modname, [fn], recipe=recipe)
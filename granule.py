@@ -193,6 +193,39 @@ class DGcmpt(Compartment):
       self.Ihf.h     = self.Ihf.h_inf(self.Em)
 
 
+def make1synapse(cell, cmpt, tau1, tau2, Er, gain=1):
+  """Add an Exp2Syn with Gmax gain nA on cmpt to cell.synlist, and
+  its gain to cell.synscale, the factor the strength of the events
+  it receives is scaled by. Exp2Syn is linear, so if cell.aggregate
+  is set a synapse with the same compartment and kinetics as one
+  already made shares its Exp2Syn, and its state, with events scaled
+  by its gain relative to that of the shared one."""
+  if not cell.synlist:
+    cell.synscale = []
+  if getattr(cell, 'aggregate', False):
+    for syn in cell.synlist:
+      if syn.owner is cmpt and syn.tau1==tau1 and syn.tau2==tau2 and \
+         syn.Er==Er:
+        cell.synlist.append(syn)
+        cell.synscale.append(gain*nA/syn.Gmax)
+        return syn
+  syn = Exp2Syn(cmpt)
+  syn.tau1 = tau1; syn.tau2 = tau2; syn.Er = Er; syn.Gmax = nA*gain
+  cell.synlist.append(syn)
+  cell.synscale.append(1.)
+  return syn
+
+def uniqueSynapses(cell):
+  """The distinct Exp2Syns of cell.synlist, in order"""
+  seen = set()
+  syns = []
+  for syn in cell.synlist:
+    if id(syn) not in seen:
+      seen.add(id(syn))
+      syns.append(syn)
+  return syns
+
+
 class SquareWaveCurrent(PyDynamics):
   def __init__(self, cell):
     PyDynamics.__init__(self, cell)
@@ -287,19 +320,14 @@ class Granule(mCell):
              gCaT=1*self.CaTscale,
              gSK=0*self.SKscale, gBK=2.4*self.BKscale)
 
-  def make1synapse(self, cmpt, tau1, tau2, Er):
-    syn = Exp2Syn(cmpt)
-    syn.tau1 = tau1; syn.tau2 = tau2; syn.Er = Er; syn.Gmax = nA
-    self.synlist.append(syn)
-    return syn
+  def make1synapse(self, cmpt, tau1, tau2, Er, gain=1):
+    return make1synapse(self, cmpt, tau1, tau2, Er, gain)
   
   def makesynapses(self):
     # PP syn based on data from Greg Hollrigel and Kevin Staley
-    d = self.make1synapse(self.dendrite[0][3], 1.5, 5.5, 0)
-    d.Gmax = d.Gmax * 0.02
+    d = self.make1synapse(self.dendrite[0][3], 1.5, 5.5, 0, gain=0.02)
     self.PPlist.append(d)
-    d = self.make1synapse(self.dendrite[1][3], 1.5, 5.5, 0)
-    d.Gmax = d.Gmax * 0.02
+    d = self.make1synapse(self.dendrite[1][3], 1.5, 5.5, 0, gain=0.02)
     self.PPlist.append(d)
     # MC syn *** Estimated
     self.make1synapse(self.dendrite[0][1], 1.5, 5.5, 0)
@@ -411,19 +439,14 @@ class Basket(mCell):
   def __str__(self):
     return 'Basket cell'
 
-  def make1synapse(self, cmpt, tau1, tau2, Er):
-    syn = Exp2Syn(cmpt)
-    syn.tau1 = tau1; syn.tau2 = tau2; syn.Er = Er; syn.Gmax = nA
-    self.synlist.append(syn)
-    return syn
+  def make1synapse(self, cmpt, tau1, tau2, Er, gain=1):
+    return make1synapse(self, cmpt, tau1, tau2, Er, gain)
 
   def makesynapses(self):
     # PP(AMPA) syn to apical dist dend Dingledine '95
-    d = self.make1synapse(self.dendrite[0][3], 2.0 , 6.3,   0)
-    d.Gmax = d.Gmax * 0.01
+    d = self.make1synapse(self.dendrite[0][3], 2.0 , 6.3,   0, gain=0.01)
     self.PPlist.append(d)
-    d = self.make1synapse(self.dendrite[1][3], 2.0 , 6.3,   0)
-    d.Gmax = d.Gmax * 0.01
+    d = self.make1synapse(self.dendrite[1][3], 2.0 , 6.3,   0, gain=0.01)
     self.PPlist.append(d)
     # GC(AMPA) syn to prox dend Geiger '97
     self.make1synapse(self.dendrite[0][0], 0.3 , 0.6,   0)
@@ -508,25 +531,18 @@ class Mossy(mCell):
   def __str__(self):
     return 'Mossy cell'
 
-  def make1synapse(self, cmpt, tau1, tau2, Er):
-    syn = Exp2Syn(cmpt)
-    syn.tau1 = tau1; syn.tau2 = tau2; syn.Er = Er; syn.Gmax = nA
-    self.synlist.append(syn)
-    return syn
+  def make1synapse(self, cmpt, tau1, tau2, Er, gain=1):
+    return make1synapse(self, cmpt, tau1, tau2, Er, gain)
 
   def makesynapses(self):
     # PP(AMPA) syn to dist dend similar to PP to GC
-    d = self.make1synapse(self.dendrite[0][3], 1.5 , 5.5,   0)
-    d.Gmax = d.Gmax * 0.005
+    d = self.make1synapse(self.dendrite[0][3], 1.5 , 5.5,   0, gain=0.005)
     self.PPlist.append(d)
-    d = self.make1synapse(self.dendrite[1][3], 1.5 , 5.5,   0)
-    d.Gmax = d.Gmax * 0.005
+    d = self.make1synapse(self.dendrite[1][3], 1.5 , 5.5,   0, gain=0.005)
     self.PPlist.append(d)
-    d = self.make1synapse(self.dendrite[2][3], 1.5 , 5.5,   0)
-    d.Gmax = d.Gmax * 0.005
+    d = self.make1synapse(self.dendrite[2][3], 1.5 , 5.5,   0, gain=0.005)
     self.PPlist.append(d)
-    d = self.make1synapse(self.dendrite[3][3], 1.5 , 5.5,   0)
-    d.Gmax = d.Gmax * 0.005
+    d = self.make1synapse(self.dendrite[3][3], 1.5 , 5.5,   0, gain=0.005)
     self.PPlist.append(d)
     # GC(AMPA) syn to prox dend similar to GC>CA3 Jonas '93
     self.make1synapse(self.dendrite[0][0], 0.5 , 6.2,   0)
@@ -607,11 +623,8 @@ class Hipp(mCell):
   def __str__(self):
     return 'HIPP cell'
 
-  def make1synapse(self, cmpt, tau1, tau2, Er):
-    syn = Exp2Syn(cmpt)
-    syn.tau1 = tau1; syn.tau2 = tau2; syn.Er = Er; syn.Gmax = nA
-    self.synlist.append(syn)
-    return syn
+  def make1synapse(self, cmpt, tau1, tau2, Er, gain=1):
+    return make1synapse(self, cmpt, tau1, tau2, Er, gain)
 
   def makesynapses(self):
     self.synlist = []
@@ -627,6 +640,26 @@ class Hipp(mCell):
     self.make1synapse(self.dendrite[2][1], 0.9 , 3.6,   0)
     self.make1synapse(self.dendrite[3][1], 0.9 , 3.6,   0)
 
+def makeNetwork(ngcell, nbcell, nmcell, nhcell, useSlow=False,
+                aggregate=False):
+  """Make the cells of the dentate network, ordered granule, basket,
+  mossy then HIPP. With aggregate the synapses of a cell that only
+  differ in strength share their state (see make1synapse).
+  Returns (Network, Ncmpt, Nstate)"""
+  Network = []
+  Ncmpt   = 0
+  Nstate  = 0
+  for (cls, n) in [(Granule, ngcell), (Basket, nbcell),
+                   (Mossy, nmcell), (Hipp, nhcell)]:
+    for i in range(n):
+      c = cls(useSlow=useSlow)
+      c.aggregate = aggregate
+      c.makesynapses()
+      Nstate = Nstate + len(c.Y)
+      Ncmpt  = Ncmpt  + len(c.compartments)
+      Network.append(c)
+  return (Network, Ncmpt, Nstate)
+
 def modifyAll(Network=[], \
     Vhalfnf=0, Vhalfns=0, \
     Vhalfm=0, Vhalfh=0, Vhalfs=0, \
@@ -683,13 +716,23 @@ def modifyAll(Network=[], \
         cmpt.Kdrs.Vhalfn = Vhalfns
       except AttributeError:
         pass
-    for syn in cell.synlist:
+    for syn in uniqueSynapses(cell):
         if syn.Er==-70:
             syn.Gmax = syn.Gmax*Ggaba
 
-def nc_append(src, tgt, synapse, weight, delay, threshold, cnxtype=''):
-    from __main__ import Network, ngcell, nbcell, nhcell, nmcell, sprout
-    from random import random
+def nc_append(src, tgt, synapse, weight, delay, threshold, cnxtype='',
+              Network=None, sprout=None, ngcell=None, rng=None):
+    """Make one connection of Network, a GC->GC one if the next draw
+    of rng, a numpy.random.RandomState(seed), is less than sprout.
+    Called once per edge in order with one rng, the GC->GC connections
+    made are those of nc_append_many with the same seed. ngcell, the
+    number of granule cells, is counted if not given. A script of
+    nc_append calls is run with nc_script."""
+    _needNetwork('nc_append', Network, sprout)
+    if rng is None:
+        raise ValueError, 'nc_append needs rng for the sprouting draws'
+    if ngcell is None:
+        ngcell = int(_isGranule(Network, len(Network)).sum())
     Ncells = len(Network)
 
     tgtcell = Network[tgt]
@@ -699,13 +742,156 @@ def nc_append(src, tgt, synapse, weight, delay, threshold, cnxtype=''):
     if src<Ncells:
         srccell = Network[src]
         if isinstance(tgtcell, Granule) and isinstance(srccell, Granule):
-            if sprout<=random():
+            if rng.random_sample()>=sprout:
                 return
         s = Synapse(srccell, tgtdyn)
         s.trans_time = delay
-        s.nominal_strength = weight
+        s.nominal_strength = weight*tgtcell.synscale[synapse]
     else:
         if isinstance(tgtcell, Granule):
-            tgtcell = Network[tgt+200]
+            tgtcell = Network[tgt+2*ngcell//5]
             tgtdyn  = tgtcell.synlist[synapse]
-        tgtdyn.enq(delay)
+        tgtdyn.enq(delay, tgtcell.synscale[synapse])
+
+def _needNetwork(fname, Network, sprout=0):
+    if Network is None or sprout is None:
+        raise ValueError, '%s needs the Network and sprout level to be ' \
+              'passed in' % fname
+
+def nc_script(fn, Network, sprout, seed=0):
+    """Run a script of literal nc_append calls, such as conx_sprout.py,
+    on Network at sprouting level sprout, drawing as nc_append_many
+    does with the same seed"""
+    import numpy
+    ngcell = int(_isGranule(Network, len(Network)).sum())
+    rng = numpy.random.RandomState(seed)
+    def append(src, tgt, synapse, weight, delay, threshold, cnxtype=''):
+        nc_append(src, tgt, synapse, weight, delay, threshold, cnxtype,
+                  Network=Network, sprout=sprout, ngcell=ngcell, rng=rng)
+    execfile(fn, {'nc_append': append})
+
+def sproutDraws(n, seed):
+    """The uniform draws deciding which of n GC->GC connections are
+    made. A connection is made when its draw is less than sprout, so
+    for a given seed the connections at one sprouting level are a
+    subset of those at any higher level."""
+    import numpy
+    return numpy.random.RandomState(seed).random_sample(n)
+
+def _isGranule(Network, n):
+    import numpy
+    isGranule = [isinstance(c, Granule) for c in Network]
+    return numpy.array(isGranule + [False]*(n-len(Network)))
+
+def nc_append_many(src, tgt, synapse, weight, delay, threshold, types,
+                   Network=None, sprout=None, seed=0, inputs=True):
+    """Vectorised nc_append. The arguments are equal length arrays
+    with one entry per connection, types being connection type codes
+    (see edges.py). Network and sprout must be given. The GC->GC
+    connections are filtered by sproutDraws(.., seed). With inputs
+    False the external (PP) input events are not queued, as when a run
+    is restored from a checkpoint."""
+    import numpy
+    _needNetwork('nc_append_many', Network, sprout)
+    src       = numpy.asarray(src)
+    tgt       = numpy.asarray(tgt)
+    synapse   = numpy.asarray(synapse)
+    threshold = numpy.asarray(threshold)
+    types     = numpy.asarray(types)
+    Ncells    = len(Network)
+    nedges    = len(src)
+    if nedges==0: return
+
+    # Resolve the target dynamics once per (tgt, synapse) pair. Pairs
+    # are visited in order of their last use so that each compartment
+    # ends up with the threshold of the last connection made to it,
+    # just as calling nc_append once per edge would leave it.
+    key  = tgt.astype(numpy.int64)*(synapse.max()+1) + synapse
+    last = nedges - 1 - numpy.unique(key[::-1], return_index=True)[1]
+    last.sort()
+    tgtdyns = {}
+    for i in last.tolist():
+        tgtdyn = Network[int(tgt[i])].synlist[int(synapse[i])]
+        tgtdyn.owner.APthreshold = float(threshold[i])
+        tgtdyns[int(key[i])] = tgtdyn
+
+    # GC->GC connections survive with probability sprout
+    isGranule = _isGranule(Network, src.max()+1)
+    internal = src<Ncells
+    keep = ~(internal & isGranule[src] & isGranule[tgt])
+    keep[~keep] = sproutDraws(nedges-keep.sum(), seed)<sprout
+    ppshift = 2*int(isGranule.sum())//5
+
+    srcl   = src.tolist()
+    tgtl   = tgt.tolist()
+    synl   = synapse.tolist()
+    keyl   = key.tolist()
+    delay  = numpy.asarray(delay).tolist()
+    weight = numpy.asarray(weight).tolist()
+    for cnxtype in numpy.unique(types):
+        indx = numpy.nonzero(keep & (types==cnxtype))[0]
+        for i in indx[internal[indx]].tolist():
+            s = Synapse(Network[srcl[i]], tgtdyns[keyl[i]])
+            s.trans_time = delay[i]
+            s.nominal_strength = weight[i]*Network[tgtl[i]].synscale[synl[i]]
+        if not inputs: continue
+        for i in indx[~internal[indx]].tolist():
+            tgtcell = Network[tgtl[i]]
+            if isinstance(tgtcell, Granule):
+                tgtcell = Network[tgtl[i]+ppshift]
+                tgtdyn = tgtcell.synlist[synl[i]]
+            else:
+                tgtdyn = tgtdyns[keyl[i]]
+            tgtdyn.enq(delay[i], tgtcell.synscale[synl[i]])
+
+def nc_edges(edges, Network=None, sprout=None, seed=0, inputs=True):
+    """Make the connections in an edge table (see edges.py)"""
+    nc_append_many(edges['src'], edges['tgt'], edges['synapse'],
+                   edges['weight'], edges['delay'], edges['threshold'],
+                   edges['type'], Network=Network, sprout=sprout, seed=seed,
+                   inputs=inputs)
+
+def nc_inputs(edges, Network):
+    """The external (PP) input events nc_edges queues, as arrays
+    (cell, synapse, time, strength) of their target cells, synlist
+    indices, arrival times and strengths"""
+    import numpy
+    src = numpy.asarray(edges['src'])
+    tgt = numpy.asarray(edges['tgt'])
+    synapse = numpy.asarray(edges['synapse'])
+    delay = numpy.asarray(edges['delay'], dtype=numpy.float64)
+    ext = src>=len(Network)
+    if not ext.any():
+        return (tgt[ext], synapse[ext], delay[ext], numpy.zeros(0))
+    isGranule = _isGranule(Network, max(src.max(), tgt.max())+1)
+    ppshift = 2*int(isGranule[:len(Network)].sum())//5
+    cells = tgt[ext] + numpy.where(isGranule[tgt[ext]], ppshift, 0)
+    strength = numpy.array([Network[c].synscale[k] for (c, k) in
+                            zip(cells.tolist(), synapse[ext].tolist())])
+    return (cells, synapse[ext], delay[ext], strength)
+
+def nc_load(fn, Network=None, sprout=None, seed=0):
+    """Make all the connections in the binary edge table fn
+    (see edges.py) in one go"""
+    from edges import readEdges
+    (edges, typenames) = readEdges(fn)
+    nc_edges(edges, Network=Network, sprout=sprout, seed=seed)
+
+def nc_sprout(edges, sprout, base=0, seed=0, Network=None):
+    """Add to a network already connected from the edge table at
+    sprouting level base the GC->GC connections it has at level
+    sprout (>=base) with the same seed."""
+    import numpy
+    _needNetwork('nc_sprout', Network)
+    src = numpy.asarray(edges['src'])
+    tgt = numpy.asarray(edges['tgt'])
+    if len(src)==0: return
+    isGranule = _isGranule(Network, src.max()+1)
+    indx  = numpy.nonzero((src<len(Network)) & isGranule[src] & \
+                          isGranule[tgt])[0]
+    draws = sproutDraws(len(indx), seed)
+    indx  = indx[(draws>=base) & (draws<sprout)]
+    for e in edges[indx].tolist():
+        s = Synapse(Network[e[0]], Network[e[1]].synlist[e[2]])
+        s.trans_time = e[4]
+        s.nominal_strength = e[3]*Network[e[1]].synscale[e[2]]
@@ -44,17 +44,17 @@ srcfiles = sys.argv[1:]
 
 name = guess_modname(srcfiles)
 
-if debug:
-    sys.argv[1:] = ['build_ext', '--inplace', '--debug']
-else:
-    sys.argv[1:] = ['build_ext', '--inplace']
-
-
 defmac = [('MPI', 1)]
-E = Extension(name,  srcfiles, define_macros=defmac)
-setup(ext_modules=[E])
 
-if debug:
+if not debug:
+    # unchanged sources are copied out of the build cache
+    import buildcache
+    buildcache.buildExtension(name, srcfiles, defmac)
+else:
+    sys.argv[1:] = ['build_ext', '--inplace', '--debug']
+    E = Extension(name,  srcfiles, define_macros=defmac)
+    setup(ext_modules=[E])
+
     import os
     # When using the debug flag the load module will be
     # called name_d.pyd. Rename it to name.pyd, but don't
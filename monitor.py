@@ -0,0 +1,122 @@
+"""
+Online spike statistics and early stopping.
+
+A Monitor counts the APs of every cell as the run goes (its ap handler
+goes alongside ap_print) and at the end of each window updates the
+running firing rate of each population. It can stop the run at the
+end of a window, by cutting gd.duration short, once the outcome is
+clear:
+
+   runaway - at least fraction of the granule cells fired faster than
+             rate (Hz) over the last span ms, a seizure like state
+   quiet   - after the PP volley (after ms) no cell has fired for
+             quiet ms. This is a heuristic: the network is taken to
+             have settled back to rest, but neither the inputs still
+             pending nor the decay of the synaptic conductances are
+             checked, so a long enough silence followed by late
+             spikes would be cut short.
+
+   m = Monitor(Network, stop=['runaway', 'quiet'])
+   gd.ap_handler = [ap_print, m.ap]
+   gd.endWindow_handler = [TimeTicker, m.endWindow]
+"""
+
+import numpy
+from p3 import message_print, info
+
+GRANULE = 'Granule cell'
+
+
+class Monitor:
+    def __init__(self, Network, stop=[], rate=50., fraction=0.5,
+                 span=50., quiet=50., after=20., start=0.):
+        """start is the time the run starts at, that of the checkpoint
+        a restored run carries on from"""
+        self.typenames = []
+        codes = []
+        for cell in Network:
+            name = str(cell)
+            if name not in self.typenames:
+                self.typenames.append(name)
+            codes.append(self.typenames.index(name))
+        self.celltypes = numpy.array(codes)
+        self.ntype = numpy.bincount(self.celltypes,
+                                    minlength=len(self.typenames))
+        for s in stop:
+            if s not in ['runaway', 'quiet']:
+                raise ValueError, 'unknown stopping criterion %s' % s
+        self.stop     = list(stop)
+        self.rate     = rate
+        self.fraction = fraction
+        self.span     = span
+        self.quiet    = quiet
+        self.after    = after
+
+        self.window  = numpy.zeros(len(Network), dtype=numpy.int64)
+        self.recent  = []       # per window counts of the last span ms
+        self.total   = numpy.zeros(len(Network), dtype=numpy.int64)
+        self.start   = start
+        self.lastAP  = -numpy.inf
+        self.time    = start
+        self.outcome = None     # criterion that stopped the run
+        self.stopTime = None
+
+    def ap(self, cell):
+        """ap_handler counting the APs of a cell"""
+        n = len(cell.soma.APtimes)
+        if n:
+            self.window[cell.id] += n
+            self.lastAP = max(self.lastAP, self.start+max(cell.soma.APtimes))
+
+    def rates(self):
+        """Mean firing rate (Hz) of each population so far"""
+        span = self.time - self.start
+        if span<=0:
+            return dict([(name, 0.) for name in self.typenames])
+        n = numpy.bincount(self.celltypes, self.total,
+                           minlength=len(self.typenames))
+        r = n*1000./(self.ntype*span)
+        return dict(zip(self.typenames, r.tolist()))
+
+    def runaway(self, gd):
+        if GRANULE not in self.typenames: return False
+        span = len(self.recent)*gd.window
+        if span<self.span: return False
+        counts = numpy.sum(self.recent, axis=0)
+        gc = self.celltypes==self.typenames.index(GRANULE)
+        fast = counts[gc]*1000./span>=self.rate
+        return fast.mean()>=self.fraction
+
+    def quiescent(self, gd):
+        return self.time>=self.after and \
+               self.time-max(self.lastAP, self.after)>=self.quiet
+
+    def endWindow(self, gd):
+        """endWindow_handler updating the statistics and stopping
+        the run when a criterion is met"""
+        # the last window is clipped to the duration
+        self.time = min(self.start + (gd.windowID+1)*gd.window,
+                        self.start + gd.duration)
+        self.total += self.window
+        self.recent.append(self.window.copy())
+        nspan = max(int(numpy.ceil(self.span/gd.window)), 1)
+        del self.recent[:-nspan]
+        self.window[:] = 0
+        if self.outcome or self.time-self.start>=gd.duration: return
+
+        for s in self.stop:
+            if (s=='runaway' and self.runaway(gd)) or \
+               (s=='quiet' and self.quiescent(gd)):
+                self.outcome = s
+                self.stopTime = self.time
+                message_print(info, 'Stopping at %gms, %s.\n' % (self.time, s))
+                gd.duration = self.time - self.start
+                break
+
+    def summary(self):
+        r = self.rates()
+        s = ', '.join(['%s %.3gHz' % (name, r[name])
+                       for name in self.typenames])
+        if self.outcome:
+            s = s + '; stopped at %gms (%s)' % (self.stopTime, self.outcome)
+        return s
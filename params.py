@@ -0,0 +1,183 @@
+"""
+Run parameters of sprout_run.py.
+
+Every parameter is declared in SCHEMA with its type, default and
+meaning. A parameter set is a plain dict with a value of the declared
+type for every name in the schema. It can be made from command line
+style 'name=value' strings, from a JSON or TOML config file or from a
+dict, and unknown names or values of the wrong type are rejected
+rather than executed. canonical() gives the set in a fixed form
+suitable for identifying a run.
+
+   >>> p = parse('Vhalfmn=2 sprout=0.5')
+   >>> describe(p)
+   'Vhalfmn=2 sprout=0.5'
+"""
+
+import os
+
+# (name, type, default, meaning)
+SCHEMA = [
+    #// define network size
+    ('ngcell',   int,   500, 'number of granule cells'),
+    ('nbcell',   int,     6, 'number of basket cells'),
+    ('nmcell',   int,    15, 'number of mossy cells'),
+    ('nhcell',   int,     6, 'number of HIPP cells'),
+
+    ('duration', float, 400, 'simulated time (ms)'),
+    ('Vhalfm',   float,   0, 'Na activation shift (mV)'),
+    ('Vhalfnf',  float,   0, 'fast delayed rectifier activation shift (mV)'),
+    ('Vhalfhf',  float,   0, 'fast Ih activation shift (mV)'),
+    ('Vhalfhs',  float,   0, 'slow Ih activation shift (mV)'),
+    ('Vhalfns',  float,   0, 'slow delayed rectifier activation shift (mV)'),
+    ('Vhalfha',  float,   0, 'A current inactivation shift (mV)'),
+    ('Vhalfma',  float,   0, 'A current activation shift (mV)'),
+    ('Vhalfmt',  float,   0, 'T type Ca activation shift (mV)'),
+    ('Vhalfmn',  float,   0, 'N type Ca activation shift (mV)'),
+    ('Vhalfml',  float,   0, 'L type Ca activation shift (mV)'),
+    ('Am',       float,   1, 'Na activation rate factor'),
+    ('Ah',       float,   1, 'Na inactivation rate factor'),
+    ('sprout',   float,   0, 'fraction of sprouted GC->GC connections made'),
+    ('Ggaba',    float,   1, 'GABA conductance factor'),
+    ('cnxseed',  int,     0, 'seed of generated connectivity'),
+    ('seed',     int,     0, 'seed of the sprouting filter'),
+    ('aggregate', int,    0,
+     'share the state of synapses differing only in strength'),
+    ('exactsyn', int,     0,
+     'exact exponential synapse decay in the Hines steps'),
+    ('warm',     int,     0,
+     'start each cell at rest (warmstart.py), not its leak potential'),
+    ('warmtime', float, 500,
+     'time (ms) an isolated cell is settled for to find its rest'),
+    ('cache',    int,     1,
+     'reuse the results of identical runs (runcache.py)'),
+    ('apformat', str, 'text', 'AP file format, text (.dat) or binary (.spk)'),
+    ('trace',    str,     '', 'ids of the cells with soma Em traced, eg 0,500'),
+    ('trformat', str, 'text', 'trace file format, text (.dat) or store (.trs)'),
+    ('asyncout', int,     0,
+     'queue length of the background output writer, 0 for none'),
+    ('stats',    int,     0,
+     'write the solver statistics of each cell to stats*.dat'),
+    ('stop',     str,     '',
+     'stop early on runaway and/or quiet (monitor.py), eg runaway,quiet'),
+    ('stoprate', float,  50, 'runaway: GC rate (Hz) over stopspan ms ...'),
+    ('stopfraction', float, 0.5, '... reached by this fraction of GCs'),
+    ('stopspan', float,  50,
+     'runaway: span (ms) the GC rates are measured over'),
+    ('stopquiet', float, 50,
+     'quiet (a heuristic): time (ms) with no APs at all ...'),
+    ('stopafter', float, 20, '... counted from the end of the PP volley (ms)'),
+    ('checkpoint', str,   '',
+     'file the network state is checkpointed to (checkpoint.py)'),
+    ('checkevery', float,  0,
+     'checkpoint every so many ms, 0 for only at the end'),
+    ('restore_from', str, '',
+     'checkpoint to carry the run on from, to duration'),
+    ]
+
+# The allowed values of parameters with a fixed set of them
+choices = {'apformat': ['text', 'binary'],
+           'trformat': ['text', 'store']}
+
+types    = dict([(name, t) for (name, t, default, doc) in SCHEMA])
+defaults = dict([(name, t(default)) for (name, t, default, doc) in SCHEMA])
+names    = [s[0] for s in SCHEMA]
+
+
+def coerce(name, value):
+    """value as the declared type of parameter name"""
+    if name not in types:
+        raise ValueError, 'unknown parameter %s' % name
+    t = types[name]
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, basestring):
+        value = value.strip()
+    try:
+        if t is int and not isinstance(value, (int, long)):
+            f = float(value)
+            if f!=int(f):
+                raise ValueError
+            value = int(f)
+        value = t(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError, 'bad value %r for %s (%s)' % \
+              (value, name, t.__name__)
+    if name in choices and value not in choices[name]:
+        raise ValueError, 'bad value %r for %s (one of %s)' % \
+              (value, name, ', '.join(choices[name]))
+    return value
+
+def fromDict(d, p=None):
+    """Parameter set with the values in d, the rest from p
+    (or the defaults)"""
+    if p is None: p = defaults
+    p = dict(p)
+    for (name, value) in d.items():
+        p[name] = coerce(name, value)
+    return p
+
+def readConfig(fn):
+    """The parameter values in a JSON (.json) or TOML (.toml) file"""
+    ext = os.path.splitext(fn)[1].lower()
+    if ext=='.json':
+        import json
+        d = json.load(open(fn))
+    elif ext=='.toml':
+        try:
+            import tomllib
+            d = tomllib.load(open(fn, 'rb'))
+        except ImportError:
+            try:
+                import toml
+            except ImportError:
+                raise ImportError, 'reading %s needs tomllib or toml' % fn
+            d = toml.load(fn)
+    else:
+        raise ValueError, 'unknown config file type %s' % fn
+    if not isinstance(d, dict):
+        raise ValueError, '%s does not hold a table of parameters' % fn
+    return d
+
+def fromArgs(args, p=None):
+    """Parameter set from a list of 'name=value' strings and config
+    file names, later ones taking precedence"""
+    if p is None: p = defaults
+    p = dict(p)
+    for s in args:
+        s = s.strip()
+        if not s: continue
+        if '=' in s:
+            (name, value) = s.split('=', 1)
+            p[name.strip()] = coerce(name.strip(), value)
+        else:
+            p = fromDict(readConfig(s), p)
+    return p
+
+def parse(x):
+    """Parameter set from a 'name=value ...' string, a list of them,
+    a dict or an existing parameter set"""
+    if isinstance(x, dict):
+        return fromDict(x)
+    if isinstance(x, basestring):
+        x = x.split()
+    return fromArgs(x)
+
+def canonical(p):
+    """p in a fixed form, a tuple of (name, value) in schema order"""
+    p = fromDict(p)
+    return tuple([(name, p[name]) for name in names])
+
+def _format(value):
+    if isinstance(value, float) and value.is_integer():
+        return '%d' % value
+    if isinstance(value, str):
+        return value
+    return '%r' % value
+
+def describe(p):
+    """'name=value ...' for the parameters of p that differ from
+    the defaults, in schema order"""
+    return ' '.join(['%s=%s' % (name, _format(value))
+                     for (name, value) in canonical(p)
+                     if value!=defaults[name]])
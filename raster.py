@@ -0,0 +1,145 @@
+"""
+Spike raster plots, the Python counterpart of raster.m.
+
+Reads a text AP file (ap*.dat), a binary one (ap*.spk) or a fixed width
+spike record file (see spikes.py, memory mapped), and plots each spike
+as a point at (time, cell number), coloured by cell type with a legend
+of the types, as raster.m does. When there are more spikes than the
+plot has pixels the spikes are binned to the pixel grid and each pixel
+takes the colour of the type with most spikes in it, so the cost of
+drawing does not grow with the number of spikes. A text AP file is
+parsed once and kept as a record file beside it (ap*.dat.rec), which
+later plots of the same file memory map instead.
+
+Usage:
+   python raster.py apfile [image]
+"""
+
+import sys, os
+import numpy
+import spikes
+
+# MATLAB's default axes colour order, which raster.m colours the types by
+COLOURS = [(0, 0, 1), (0, 0.5, 0), (1, 0, 0), (0, 0.75, 0.75),
+           (0.75, 0, 0.75), (0.75, 0.75, 0), (0.25, 0.25, 0.25)]
+
+
+def pick(cells, n, seed=0):
+    """Mask of the spikes of n randomly chosen cells"""
+    ucells = numpy.unique(cells)
+    if n>=len(ucells):
+        return numpy.ones(len(cells), dtype=bool)
+    chosen = numpy.random.RandomState(seed).permutation(ucells)[:n]
+    return numpy.in1d(cells, chosen)
+
+def load(fn):
+    """The spikes of the AP file fn, as spikes.load gives them. A text
+    file is converted to the record file fn.rec the first time, and
+    that is memory mapped as long as it is newer than fn."""
+    f = open(fn, 'rb')
+    magic = f.read(8)
+    f.close()
+    if magic in [spikes.MAGIC, spikes.RECMAGIC]:
+        return spikes.load(fn)
+    recfn = fn + '.rec'
+    if not os.path.exists(recfn) or \
+       os.path.getmtime(recfn)<os.path.getmtime(fn):
+        (cells, times, types, typenames) = spikes.load(fn)
+        try:
+            spikes.writeRecords(recfn, cells, times, types, typenames)
+        except (IOError, OSError):
+            # read only, plot this once from the text
+            return (cells, times, types, typenames)
+    return spikes.load(recfn)
+
+def raster(fn, ax=None, ncells=None, title=None, maxpoints=None):
+    """Raster plot of the AP file fn on the axes ax (a new figure if
+    None), of ncells randomly chosen cells if given. The spikes are
+    binned to pixels when there are more than maxpoints (default the
+    number of pixels in the axes). Returns the axes."""
+    import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
+
+    (cells, times, types, typenames) = load(fn)
+    if ncells is not None:
+        keep = pick(cells, ncells)
+        (cells, times, types) = (cells[keep], times[keep], types[keep])
+
+    if ax is None:
+        fig = plt.figure()
+        try:
+            fig.canvas.set_window_title('Spike Raster Plot')
+        except AttributeError:
+            pass
+        ax = fig.add_subplot(111)
+    fig = ax.figure
+    bbox = ax.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
+    (wpix, hpix) = (int(bbox.width*fig.dpi), int(bbox.height*fig.dpi))
+    if maxpoints is None:
+        maxpoints = wpix*hpix
+
+    # types in name order, as raster.m's unique() gives them
+    order = numpy.argsort(typenames)
+    present = numpy.unique(types)
+    colour = {}
+    for (i, code) in enumerate([c for c in order if c in present]):
+        colour[code] = COLOURS[i % len(COLOURS)]
+
+    if len(times)==0:
+        print 'Empty input'
+    elif len(times)<=maxpoints:
+        for code in sorted(colour.keys(), key=lambda c: typenames[c]):
+            sel = types==code
+            ax.plot(times[sel], cells[sel], linestyle='none', marker='o',
+                    markersize=4, markerfacecolor='black',
+                    markeredgecolor=colour[code])
+    else:
+        # bin to the pixel grid, colouring by the commonest type
+        (t0, t1) = (times.min(), times.max())
+        (c0, c1) = (cells.min(), cells.max()+1)
+        if t1<=t0: t1 = t0 + 1
+        nx = wpix
+        ny = min(hpix, c1-c0)
+        ix = numpy.minimum(((times-t0)/(t1-t0)*nx).astype(int), nx-1)
+        iy = ((cells-c0)*ny)//(c1-c0)
+        codes = sorted(colour.keys())
+        counts = numpy.zeros((len(codes), ny, nx), dtype=numpy.int32)
+        for (k, code) in enumerate(codes):
+            sel = types==code
+            counts[k] = numpy.bincount(iy[sel]*nx + ix[sel],
+                                       minlength=nx*ny).reshape(ny, nx)
+        top = counts.argmax(axis=0)
+        image = numpy.ones((ny, nx, 3))
+        palette = numpy.array([colour[code] for code in codes])
+        hit = counts.sum(axis=0)>0
+        image[hit] = palette[top[hit]]
+        ax.imshow(image, origin='lower', aspect='auto',
+                  interpolation='nearest', extent=(t0, t1, c0, c1))
+
+    ax.set_xlabel('Time (ms)')
+    ax.set_ylabel('cell number')
+    ax.grid(True)
+    codes = sorted(colour.keys(), key=lambda c: typenames[c])
+    if len(codes)>0 and typenames[codes[0]]:
+        handles = [Line2D([], [], linestyle='none', marker='o',
+                          markersize=4, markerfacecolor='black',
+                          markeredgecolor=colour[c]) for c in codes]
+        ax.legend(handles, [typenames[c] for c in codes], numpoints=1)
+    if title:
+        ax.set_title(title)
+    return ax
+
+
+if __name__=='__main__':
+    if len(sys.argv) not in [2, 3]:
+        print 'Usage: python raster.py apfile [image]'
+        sys.exit(1)
+    if len(sys.argv)==3:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    raster(sys.argv[1], title=sys.argv[1])
+    if len(sys.argv)==3:
+        plt.savefig(sys.argv[2])
+    else:
+        plt.show()
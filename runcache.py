@@ -0,0 +1,139 @@
+"""
+Content addressed cache of sprout_run.py results.
+
+A run is keyed by a hash of everything its spikes depend on: the
+canonical run parameters (see params.py, they include the seeds), the
+GD settings, the digest of the connectivity (the edge table, or the
+generator for networks that are made procedurally) and the digests of
+the compiled aradi and Exp2Syn extensions, the simulator core and
+granule.py. A run whose key is already in the cache is not made again,
+its AP and solver statistics files are copied out of the cache
+instead.
+
+The cache is a directory with one subdirectory per key. It is kept
+under maxsize bytes by evicting the least recently used entries.
+"""
+
+import sys, os, shutil
+from hashlib import sha1
+import params
+
+CACHEDIR = 'runcache'
+MAXSIZE  = 1<<30
+
+# Run parameters that do not change the results
+volatile = ['cache', 'asyncout']
+
+_digests = {}
+def fileDigest(fn):
+    """sha1 of the contents of the file fn, remembered per
+    file modification time"""
+    fn = os.path.abspath(fn)
+    mtime = os.path.getmtime(fn)
+    if fn in _digests and _digests[fn][0]==mtime:
+        return _digests[fn][1]
+    h = sha1()
+    f = open(fn, 'rb')
+    while True:
+        b = f.read(1<<20)
+        if not b: break
+        h.update(b)
+    f.close()
+    _digests[fn] = (mtime, h.hexdigest())
+    return _digests[fn][1]
+
+def moduleDigest(name):
+    """Digest of the file the module name was loaded from"""
+    __import__(name)
+    fn = sys.modules[name].__file__
+    if fn[-4:] in ['.pyc', '.pyo']:
+        fn = fn[:-1]
+    return fileDigest(fn)
+
+def runKey(p, settings, cnxfn):
+    """Cache key of a run with parameters p, GD settings and the
+    connectivity in the file cnxfn"""
+    h = sha1()
+    for (k, v) in params.canonical(p):
+        if k in volatile: continue
+        h.update('%s=%r\n' % (k, v))
+    for k in sorted(settings.keys()):
+        h.update('gd.%s=%r\n' % (k, settings[k]))
+    h.update('cnx=%s\n' % fileDigest(cnxfn))
+    for name in ['aradi', 'Exp2Syn', 'parplex._p3', 'granule']:
+        h.update('%s=%s\n' % (name, moduleDigest(name)))
+    return h.hexdigest()
+
+
+def _entry(key, cachedir):
+    return os.path.join(cachedir, key)
+
+def fetch(key, apfile, statsfn=None, cachedir=CACHEDIR):
+    """Copy the cached results of key to apfile (and statsfn).
+    Returns False if key is not in the cache."""
+    d = _entry(key, cachedir)
+    if not os.path.exists(os.path.join(d, 'ap.dat')):
+        return False
+    if statsfn and not os.path.exists(os.path.join(d, 'stats.dat')):
+        return False
+    shutil.copyfile(os.path.join(d, 'ap.dat'), apfile)
+    if statsfn:
+        shutil.copyfile(os.path.join(d, 'stats.dat'), statsfn)
+    os.utime(d, None)
+    return True
+
+def store(key, apfile, statsfn=None, cachedir=CACHEDIR):
+    """Put the results of a run into the cache under key"""
+    d = _entry(key, cachedir)
+    if os.path.exists(d):
+        shutil.rmtree(d, True)
+    if not os.path.isdir(cachedir):
+        try:
+            os.makedirs(cachedir)
+        except OSError:
+            # made by another worker in the meantime
+            pass
+    # build the entry aside so a half written one is never seen
+    tmp = '%s.%d' % (d, os.getpid())
+    os.mkdir(tmp)
+    shutil.copyfile(apfile, os.path.join(tmp, 'ap.dat'))
+    if statsfn:
+        shutil.copyfile(statsfn, os.path.join(tmp, 'stats.dat'))
+    try:
+        os.rename(tmp, d)
+    except OSError:
+        shutil.rmtree(tmp, True)
+
+def evict(maxsize=MAXSIZE, cachedir=CACHEDIR):
+    """Remove the least recently used entries until the cache
+    takes up no more than maxsize bytes. Returns the number removed."""
+    if not os.path.isdir(cachedir):
+        return 0
+    entries = []
+    total = 0
+    for key in os.listdir(cachedir):
+        d = _entry(key, cachedir)
+        if '.' in key or not os.path.isdir(d): continue
+        size = 0
+        for fn in os.listdir(d):
+            size = size + os.path.getsize(os.path.join(d, fn))
+        entries.append((os.path.getmtime(d), size, d))
+        total = total + size
+    entries.sort()
+    n = 0
+    for (mtime, size, d) in entries:
+        if total<=maxsize: break
+        shutil.rmtree(d, True)
+        total = total - size
+        n = n + 1
+    return n
+
+
+if __name__=='__main__':
+    if len(sys.argv)>1 and sys.argv[1]=='clear':
+        shutil.rmtree(CACHEDIR, True)
+    elif len(sys.argv)>2 and sys.argv[1]=='evict':
+        print 'Evicted %d runs' % evict(int(float(sys.argv[2])))
+    else:
+        print 'Usage: python runcache.py clear | evict maxbytes'
+        sys.exit(1)
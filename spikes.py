@@ -0,0 +1,278 @@
+"""
+Binary spike (AP) files.
+
+The binary equivalent of the text AP files written by support.ap_print,
+where each line is
+
+   cellid time "celltype"
+
+A binary file is a magic string followed by chunks, one per flush of
+the writer (at the end of each window, or every CHUNK spikes). Each
+chunk holds its spikes column by column:
+
+   8 bytes        magic 'P3SPIKE1'
+   chunk:
+     uint32       number of spikes n
+     uint32       number of new cell type names m
+     32 bytes/name  NUL padded names, coded in order of appearance
+     int32[n]     cell ids
+     float64[n]   spike times
+     uint8[n]     cell type codes
+
+all little endian. A file cut short by a crash is read up to its last
+complete chunk.
+
+Merged spike files (see apmerge.py), and text files once raster.py has
+parsed them, can also be kept as fixed width records, which can be
+memory mapped and indexed directly:
+
+   8 bytes        magic 'P3APREC1'
+   uint64         number of spikes n
+   records        RECORD_DTYPE[n]
+   uint32         number of cell type names m
+   32 bytes/name  NUL padded names
+
+Usage (conversion to the text format):
+   python spikes.py ap.spk [ap.dat]
+"""
+
+import sys, os, re, struct
+import numpy
+
+MAGIC = 'P3SPIKE1'
+NAMELEN = 32
+CHUNKHEAD = struct.Struct('<II')
+CHUNK = 1<<16           # spikes buffered before a chunk is written anyway
+
+RECMAGIC = 'P3APREC1'
+RECORD_DTYPE = numpy.dtype([('cell', '<i4'),
+                            ('time', '<f8'),
+                            ('type', 'u1')])
+
+
+class SpikeWriter:
+    """Buffered writer of a binary spike file"""
+    def __init__(self, fn):
+        self.fn = fn
+        self.f = open(fn, 'wb')
+        self.f.write(MAGIC)
+        self.typenames = []
+        self.newtypes = []
+        self.codes = {}
+        self.ids = []
+        self.times = []
+        self.types = []
+
+    def add(self, cellid, times, typename):
+        """Buffer the spikes of one cell"""
+        times = list(times)
+        if not times: return
+        code = self.codes.get(typename)
+        if code is None:
+            if len(self.typenames)>255:
+                raise ValueError, 'too many cell types'
+            if len(typename)>=NAMELEN:
+                raise ValueError, 'cell type name %s is too long' % typename
+            code = self.codes[typename] = len(self.typenames)
+            self.typenames.append(typename)
+            self.newtypes.append(typename)
+        n = len(times)
+        self.ids.extend([cellid]*n)
+        self.times.extend(times)
+        self.types.extend([code]*n)
+        if len(self.ids)>=CHUNK:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered spikes as one chunk"""
+        if not self.ids and not self.newtypes: return
+        f = self.f
+        f.write(CHUNKHEAD.pack(len(self.ids), len(self.newtypes)))
+        for name in self.newtypes:
+            f.write(struct.pack('%ds' % NAMELEN, name))
+        f.write(numpy.array(self.ids,   dtype='<i4').tostring())
+        f.write(numpy.array(self.times, dtype='<f8').tostring())
+        f.write(numpy.array(self.types, dtype='u1').tostring())
+        f.flush()
+        self.newtypes = []
+        self.ids = []
+        self.times = []
+        self.types = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+def iterChunks(fn):
+    """Read a binary spike file a chunk at a time. Yields
+    (ids, times, types, typenames), typenames being those so far"""
+    f = open(fn, 'rb')
+    if f.read(len(MAGIC))!=MAGIC:
+        f.close()
+        raise IOError, '%s is not a binary spike file' % fn
+    typenames = []
+    while True:
+        head = f.read(CHUNKHEAD.size)
+        if len(head)<CHUNKHEAD.size: break
+        (n, m) = CHUNKHEAD.unpack(head)
+        data = f.read(NAMELEN*m + 13*n)
+        if len(data)<NAMELEN*m + 13*n: break
+        pos = 0
+        for i in range(m):
+            typenames.append(data[pos:pos+NAMELEN].rstrip('\0'))
+            pos = pos + NAMELEN
+        ids   = numpy.frombuffer(data, '<i4', n, pos)
+        times = numpy.frombuffer(data, '<f8', n, pos+4*n)
+        types = numpy.frombuffer(data, 'u1',  n, pos+12*n)
+        yield (ids, times, types, typenames)
+    f.close()
+
+def readSpikes(fn):
+    """Read a binary spike file.
+    Returns (ids, times, types, typenames)"""
+    typenames = []
+    ids = []
+    times = []
+    types = []
+    for (i, t, c, typenames) in iterChunks(fn):
+        ids.append(i)
+        times.append(t)
+        types.append(c)
+    if not ids:
+        return (numpy.zeros(0, 'i4'), numpy.zeros(0), numpy.zeros(0, 'u1'),
+                typenames)
+    return (numpy.concatenate(ids), numpy.concatenate(times),
+            numpy.concatenate(types), typenames)
+
+
+class RecordWriter:
+    """Writer of a fixed width spike record file, one spike at a time"""
+    def __init__(self, fn):
+        self.f = open(fn, 'wb')
+        self.f.write(struct.pack('<8sQ', RECMAGIC, 0))
+        self.typenames = []
+        self.codes = {}
+        self.n = 0
+        self.buf = []
+
+    def write(self, cellid, time, typename):
+        code = self.codes.get(typename)
+        if code is None:
+            if len(self.typenames)>255:
+                raise ValueError, 'too many cell types'
+            if len(typename)>=NAMELEN:
+                raise ValueError, 'cell type name %s is too long' % typename
+            code = self.codes[typename] = len(self.typenames)
+            self.typenames.append(typename)
+        self.buf.append((cellid, time, code))
+        if len(self.buf)>=CHUNK:
+            self.flush()
+
+    def flush(self):
+        if not self.buf: return
+        self.f.write(numpy.array(self.buf, dtype=RECORD_DTYPE).tostring())
+        self.n = self.n + len(self.buf)
+        self.buf = []
+
+    def close(self):
+        self.flush()
+        self.f.write(struct.pack('<I', len(self.typenames)))
+        for name in self.typenames:
+            self.f.write(struct.pack('%ds' % NAMELEN, name))
+        self.f.seek(len(RECMAGIC))
+        self.f.write(struct.pack('<Q', self.n))
+        self.f.close()
+
+def writeRecords(fn, cells, times, types, typenames):
+    """Write whole arrays of spikes to the spike record file fn, by
+    way of a temporary file renamed to fn"""
+    for name in typenames:
+        if len(name)>=NAMELEN:
+            raise ValueError, 'cell type name %s is too long' % name
+    r = numpy.zeros(len(cells), dtype=RECORD_DTYPE)
+    (r['cell'], r['time'], r['type']) = (cells, times, types)
+    tmp = '%s.%d' % (fn, os.getpid())
+    f = open(tmp, 'wb')
+    f.write(struct.pack('<8sQ', RECMAGIC, len(r)))
+    f.write(r.tostring())
+    f.write(struct.pack('<I', len(typenames)))
+    for name in typenames:
+        f.write(struct.pack('%ds' % NAMELEN, name))
+    f.close()
+    os.rename(tmp, fn)
+
+def readRecords(fn, mode='r'):
+    """Memory map a fixed width spike record file.
+    Returns (records, typenames)"""
+    f = open(fn, 'rb')
+    (magic, n) = struct.unpack('<8sQ', f.read(16))
+    if magic!=RECMAGIC:
+        f.close()
+        raise IOError, '%s is not a spike record file' % fn
+    f.seek(16 + RECORD_DTYPE.itemsize*n)
+    (m,) = struct.unpack('<I', f.read(4))
+    typenames = [f.read(NAMELEN).rstrip('\0') for i in range(m)]
+    f.close()
+    if n==0:
+        return (numpy.zeros(0, dtype=RECORD_DTYPE), typenames)
+    records = numpy.memmap(fn, dtype=RECORD_DTYPE, mode=mode,
+                           offset=16, shape=(n,))
+    return (records, typenames)
+
+# A line of a text AP file: cellid time "celltype"
+_apexp = re.compile(r'^[ \t]*(-?\d+)[ \t]+(\S+)' +
+                    r'[ \t]*"?([^"\r\n]*)"?[ \t]*\r?$', re.M)
+
+def load(fn):
+    """The spikes of an AP file of any format.
+    Returns (cells, times, types, typenames)"""
+    f = open(fn, 'rb')
+    magic = f.read(8)
+    f.close()
+    if magic==RECMAGIC:
+        (r, typenames) = readRecords(fn)
+        return (r['cell'], r['time'], r['type'], typenames)
+    if magic==MAGIC:
+        return readSpikes(fn)
+
+    # The names are quoted, so splitting the whole file at the quotes
+    # leaves the numbers and the names in alternate parts, each parsed
+    # in one go rather than line by line
+    parts = open(fn, 'rb').read().split('"')
+    x = numpy.fromstring(' '.join(parts[0::2]), sep=' ')
+    names = numpy.array(parts[1::2], dtype=str)
+    if len(x)==2*len(names):
+        cells = x[0::2].astype('i4')
+        times = x[1::2]
+    else:
+        # some lines have no quoted cell type
+        a = numpy.fromregex(fn, _apexp, [('cell', 'i4'), ('time', 'f8'),
+                                         ('name', 'S64')])
+        (cells, times, names) = (a['cell'], a['time'], a['name'])
+    (typenames, types) = numpy.unique(names, return_inverse=True)
+    typenames = list(typenames)
+    return (cells, times, types.astype('u1'), typenames)
+
+def toText(fn, textfn):
+    """Convert the binary spike file fn to the text AP format.
+    Returns the number of spikes."""
+    (ids, times, types, typenames) = readSpikes(fn)
+    f = open(textfn, 'w')
+    for (i, t, c) in zip(ids.tolist(), times.tolist(), types.tolist()):
+        f.write('%d %g "%s"\n' % (i, t, typenames[c]))
+    f.close()
+    return len(ids)
+
+
+if __name__=='__main__':
+    if len(sys.argv) not in [2, 3]:
+        print 'Usage: python spikes.py ap.spk [ap.dat]'
+        sys.exit(1)
+    fn = sys.argv[1]
+    if len(sys.argv)==3:
+        textfn = sys.argv[2]
+    else:
+        textfn = re.sub(r'\.spk$', '', fn) + '.dat'
+    n = toText(fn, textfn)
+    print 'Wrote %d spikes to %s' % (n, textfn)
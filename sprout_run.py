@@ -28,118 +28,245 @@ from p3 import *
 from time import clock
 from granule import *
 from support import *
+from monitor import Monitor
+import params
 
-comment = ''
-for c in sys.argv[1:]:
-    if c=='' or c==' ': continue
-    comment = comment + ' %s' % c
-apfn   = 'ap%s' % comment
-setAPfilename(apfn)
+# The parameters passed on to modifyAll
+modified = ['Vhalfm', 'Am', 'Ah', 'Vhalfns', 'Vhalfnf', 'Vhalfmt',
+            'Vhalfml', 'Vhalfmn', 'Vhalfhf', 'Vhalfhs', 'Ggaba',
+            'Vhalfma', 'Vhalfha']
 
-#// define network size
-ngcell = 500
-nbcell = 6
-nmcell = 15
-nhcell = 6
+def parseArgs(args):
+    """Run parameters (see params.py) from a list of 'name=value'
+    strings and config file names"""
+    return params.fromArgs(args)
 
 #####################################
 #// NETWORK SPECIFICATION INTERFACE #
 #####################################
-Nstate = 0
-Ncmpt  = 0
-Gcell  = []
-for i in range(ngcell):
-    c = Granule(useSlow=True)
-    c.makesynapses()
-    Nstate = Nstate + len(c.Y)
-    Ncmpt  = Ncmpt  + len(c.compartments)
-    Gcell.append(c)
-Bcell = []
-for i in range(nbcell):
-    c = Basket(useSlow=True)
-    c.makesynapses()
-    Nstate = Nstate + len(c.Y)
-    Ncmpt  = Ncmpt  + len(c.compartments)
-    Bcell.append(c)
-Mcell = []
-for i in range(nmcell):
-    c = Mossy(useSlow=True)
-    c.makesynapses()
-    Nstate = Nstate + len(c.Y)
-    Ncmpt  = Ncmpt  + len(c.compartments)
-    Mcell.append(c)
-Hcell = []
-for i in range(nhcell):
-    c = Hipp(useSlow=True)
-    c.makesynapses()
-    Nstate = Nstate + len(c.Y)
-    Ncmpt  = Ncmpt  + len(c.compartments)
-    Hcell.append(c)
-
-duration = 400
-Vhalfm  = 0
-Vhalfnf = 0
-Vhalfhf = 0
-Vhalfhs = 0
-Vhalfns = 0
-Vhalfha = 0
-Vhalfma = 0
-Vhalfmt = 0
-Vhalfmn = 0
-Vhalfml = 0
-Am = 1
-Ah = 1
-sprout = 0
-Ggaba = 1
-for s in sys.argv[1:]:
-    exec(s)
-    
-Network = Gcell+Bcell+Mcell+Hcell
-s = 'Network with %d cells, %d compartments and %d state variables\n'
-message_print(info, s % (len(Network), Ncmpt, Nstate))
-
-modifyAll(Network=Network, Vhalfm=Vhalfm, Am=Am, Ah=Ah, \
-    Vhalfns=Vhalfns, Vhalfnf=Vhalfnf, \
-    Vhalfmt=Vhalfmt, \
-    Vhalfml=Vhalfml, \
-    Vhalfmn=Vhalfmn, \
-    Vhalfhf=Vhalfhf, \
-    Vhalfhs=Vhalfhs, \
-    Ggaba=Ggaba, \
-    Vhalfma=Vhalfma, Vhalfha=Vhalfha, \
-    )
-
-message_print(info, 'Making connections.\n')
-execfile('conx_sprout.py')
-            
+def makeCells(p):
+    (Network, Ncmpt, Nstate) = makeNetwork(p['ngcell'], p['nbcell'],
+                                          p['nmcell'], p['nhcell'],
+                                          useSlow=True,
+                                          aggregate=p['aggregate'])
+    s = 'Network with %d cells, %d compartments and %d state variables\n'
+    message_print(info, s % (len(Network), Ncmpt, Nstate))
+    return Network
+
+def cnxFile(p):
+    """The file the connectivity for parameters p comes from"""
+    if (p['ngcell'], p['nbcell'], p['nmcell'], p['nhcell'])==(500, 6, 15, 6):
+        cnxscript = 'conx_sprout.py'
+        cnxfn     = 'conx_sprout.edg'
+        if not os.path.exists(cnxfn) or \
+           os.path.getmtime(cnxfn)<os.path.getmtime(cnxscript):
+            from edges import convertScript
+            message_print(info, 'Converting %s to %s.\n' % (cnxscript, cnxfn))
+            convertScript(cnxscript, cnxfn)
+        return cnxfn
+    else:
+        import conxgen
+        return conxgen.__file__.replace('.pyc', '.py')
+
+def loadEdges(p):
+    """The edge table (see edges.py) of the network for parameters p"""
+    cnxfn = cnxFile(p)
+    if cnxfn.endswith('.edg'):
+        from edges import readEdges
+        (edges, typenames) = readEdges(cnxfn)
+    else:
+        from conxgen import makeEdges
+        (edges, typenames) = makeEdges(p['ngcell'], p['nbcell'],
+                                       p['nmcell'], p['nhcell'], p['cnxseed'])
+        message_print(info, 'Generated %d connections.\n' % len(edges))
+    return edges
+
+def connect(Network, p, edges=None):
+    message_print(info, 'Making connections.\n')
+    if edges is None:
+        edges = loadEdges(p)
+    nc_edges(edges, Network=Network, sprout=p['sprout'], seed=p['seed'],
+             inputs=not p['restore_from'])
+
+def modify(Network, p):
+    modifyAll(Network=Network, **dict([(k, p[k]) for k in modified]))
+
+def prepare(Network, p):
+    """Apply the channel modifications and synapse settings and, if
+    p['warm'], start the cells from their rest states"""
+    modify(Network, p)
+    if p['exactsyn']:
+        for cell in Network:
+            for syn in uniqueSynapses(cell):
+                syn.exact = 1
+    if p['warm']:
+        from warmstart import warmStart
+        warmStart(Network, True, dict([(k, p[k]) for k in modified]),
+                  p['warmtime'])
+
+def build(p):
+    """Make the connected network for the run parameters p"""
+    Network = makeCells(p)
+    prepare(Network, p)
+    connect(Network, p)
+    return Network
+
 ###############
 # Run options #
 ###############
-gd = GD()
-gd.duration   = duration
-gd.tolerance  = 1e-3
-gd.minStep    = 0.05
-gd.network    = Network
-gd.ap_handler = ap_print
-gd.trace_handler     = trace_print
-gd.endWindow_handler = TimeTicker
-gd.stepTrace_handler = None
-gd.dumpCell_handler  = dumpcell
+def gdSettings(p):
+    return dict(duration  = p['duration'],
+                tolerance = 1e-3,
+                minStep   = 0.05,
+                window    = 20)
+
+def makeMonitor(Network, p, start=0.):
+    stop = p['stop'].replace(',', ' ').split()
+    return Monitor(Network, stop, rate=p['stoprate'],
+                   fraction=p['stopfraction'], span=p['stopspan'],
+                   quiet=p['stopquiet'], after=p['stopafter'], start=start)
+
+def makeCheckpointer(Network, p, start=0.):
+    from checkpoint import Checkpointer
+    inputs = nc_inputs(loadEdges(p), Network)
+    return Checkpointer(Network, p['checkpoint'], p['checkevery'],
+                        inputs, start)
+
+def makeGD(Network, p, mon, ckpt=None, start=0.):
+    gd = GD()
+    for (k, v) in gdSettings(p).items():
+        setattr(gd, k, v)
+    gd.duration   = p['duration'] - start
+    aps  = [ap_print, mon.ap]
+    ends = [TimeTicker, ap_flush, trace_flush, mon.endWindow]
+    if ckpt:
+        aps.append(ckpt.ap)
+        ends.append(ckpt.endWindow)
+    gd.network    = Network
+    gd.ap_handler = aps
+    gd.trace_handler     = trace_print
+    gd.endWindow_handler = ends
+    gd.stepTrace_handler = None
+    gd.dumpCell_handler  = dumpcell
+    return gd
 
 #######
 # Run #
 #######
-try:
-    start = clock()
-    message_print(info, 'Starting run.\n')
-    parplex(gd)
-    message_print(info, 'made it in %fs\n' % (clock()-start))
-except ParplexRuntimeError:
-    (e, v) = sys.exc_info()[:2]
-    message_print(fatal, 'Caught ParplexRuntimeError: %s\n' % v)
-    dumpcell(e.currentCell, fatal)
-    message_print(fatal, 'Didn\'t make it\n')
-    sys.exit(0)
+def tracedCells(p):
+    return [int(i) for i in p['trace'].replace(',', ' ').split()]
+
+def simulate(Network, p, apfn, statsfn=None, trfn='trace'):
+    """Run the connected network, writing APs to apfn.dat (.spk), the
+    traces of the cells in p['trace'] to trfn.dat (.trs) and, if
+    statsfn is given, the solver statistics of each cell to statsfn.
+    A network connected for p['restore_from'] carries on from that
+    checkpoint. Returns True if the run made it."""
+    t0 = 0.
+    if p['restore_from']:
+        from checkpoint import restore
+        t0 = restore(Network, p['restore_from'])
+        if t0>=p['duration']:
+            raise ValueError, '%s is at %gms, past duration=%g' % \
+                  (p['restore_from'], t0, p['duration'])
+    setTimeOffset(t0)
+    setAPfilename(apfn)
+    setAPformat(p['apformat'])
+    setTRfilename(trfn)
+    setTRformat(p['trformat'])
+    for i in tracedCells(p):
+        Network[i].soma.emtrace = True
+    mon = makeMonitor(Network, p, t0)
+    ckpt = None
+    if p['checkpoint']:
+        ckpt = makeCheckpointer(Network, p, t0)
+    gd = makeGD(Network, p, mon, ckpt, t0)
+    if p['asyncout']:
+        startAsyncOutput(p['asyncout'])
+    try:
+        start = clock()
+        message_print(info, 'Starting run.\n')
+        parplex(gd)
+        message_print(info, 'made it in %fs\n' % (clock()-start))
+        message_print(info, 'Rates: %s\n' % mon.summary())
+    except ParplexRuntimeError:
+        (e, v) = sys.exc_info()[:2]
+        message_print(fatal, 'Caught ParplexRuntimeError: %s\n' % v)
+        dumpcell(e.currentCell, fatal)
+        message_print(fatal, 'Didn\'t make it\n')
+        closeOutput(p)
+        return False
+    closeOutput(p)
+    if statsfn:
+        writeSolverStats(gd, Network, statsfn)
+    return True
+
+def closeOutput(p):
+    apfile_close()
+    tracefile_close()
+    if p['asyncout']:
+        blocked = stopAsyncOutput()
+        message_print(info, 'Output held up the run for %gs\n' % blocked)
+
+def apFile(p, apfn):
+    return apfn + {'text': '.dat', 'binary': '.spk'}[p['apformat']]
+
+def cacheKey(p):
+    """The run cache key for parameters p, None if not caching"""
+    if not p['cache'] or tracedCells(p) or mpi_size!=1 or \
+       p['checkpoint'] or p['restore_from']:
+        return None
+    import runcache
+    return runcache.runKey(p, gdSettings(p), cnxFile(p))
+
+def fromCache(p, apfn, statsfn=None):
+    """Fetch the results of an identical earlier run into apfn.dat
+    (.spk) and statsfn. Returns True if there was one."""
+    key = cacheKey(p)
+    if key is None:
+        return False
+    import runcache
+    if not runcache.fetch(key, apFile(p, apfn), statsfn):
+        return False
+    message_print(info, 'Results for %s from the run cache.\n' % apfn)
+    return True
+
+def toCache(p, apfn, statsfn=None):
+    key = cacheKey(p)
+    if key is None:
+        return
+    import runcache
+    runcache.store(key, apFile(p, apfn), statsfn)
+    runcache.evict()
+
+def run(p, apfn, statsfn=None, trfn='trace'):
+    """Build and run the network for the run parameters p,
+    unless the run cache already has the results"""
+    if fromCache(p, apfn, statsfn):
+        return True
+    ok = simulate(build(p), p, apfn, statsfn, trfn)
+    if ok:
+        toCache(p, apfn, statsfn)
+    return ok
+
+
+if __name__=='__main__':
+    comment = ''
+    for c in sys.argv[1:]:
+        if c=='' or c==' ': continue
+        comment = comment + ' %s' % c
+    try:
+        p = parseArgs(sys.argv[1:])
+    except ValueError, e:
+        print 'sprout_run.py: %s' % e
+        print 'Parameters (name=value, or a .json/.toml file of them):'
+        for (name, t, default, doc) in params.SCHEMA:
+            print '  %-9s %-5s %-6s %s' % (name, t.__name__, default, doc)
+        sys.exit(1)
+    statsfn = None
+    if p['stats']:
+        statsfn = 'stats%s.dat' % comment
+    run(p, 'ap%s' % comment, statsfn)
 
 #try:
 #    from py2mat import Matwrap
@@ -15,6 +15,14 @@ if os.name == 'nt':
         pass
 
 
+# Added to the times of the APs and traces written, the time a run
+# restored from a checkpoint (see checkpoint.py) carries on from
+timeoffset = 0.
+def setTimeOffset(t):
+    global timeoffset
+    timeoffset = t
+
+
 ##############################################
 # Special trace capture so that neurons with #
 # differing numbers of compartments can be   #
@@ -22,14 +30,31 @@ if os.name == 'nt':
 ##############################################
 tracex = None
 trfilename = 'trace'
+trformat = 'text'
 def setTRfilename(s):
     global trfilename
     trfilename = s
 
+def setTRformat(s):
+    """'text' for trace*.dat files, 'store' for compressed
+    trace*.trs files (see tracestore.py)"""
+    global trformat
+    if s not in ['text', 'store']:
+        raise ValueError, 'unknown trace file format %s' % s
+    trformat = s
+
 def trace_print(cell):
     global tracex
     tracex = openTraceFile(tracex)
 
+    if trformat=='store' or outq or timeoffset:
+        series = traceSeries(cell)
+        if outq:
+            outq.put(trace_write, tracex, cell.id, series)
+        else:
+            trace_write(tracex, cell.id, series)
+        return
+
     for j in range(len(cell.compartments)):
         cmpt = cell.compartments[j]
         if not cmpt.emtrace: continue
@@ -50,6 +75,65 @@ def trace_print(cell):
             
     tracex.flush()
 
+def traceSeries(cell):
+    """Copy of a window's trace samples of cell, a list of
+    (cmpt, var, times, values)"""
+    series = []
+    for j in range(len(cell.compartments)):
+        cmpt = cell.compartments[j]
+        if not cmpt.emtrace: continue
+        times = [t+timeoffset for t in cmpt.traceTimes]
+        series.append((j, 'Em', times, list(cmpt.traceData)))
+
+    if cell.synlist and cell.synlist[0].trace:
+        d = cell.synlist[0]
+        cmpt = d.owner
+        times = [t+timeoffset for t in cmpt.traceTimes]
+        j = list(cell.compartments).index(cmpt)
+        series.append((j, 'A', times, list(d.ATrace)[:len(times)]))
+        series.append((j, 'B', times, list(d.BTrace)[:len(times)]))
+
+    return series
+
+def trace_write(tracex, cellid, series):
+    """Write the traceSeries of a cell"""
+    if trformat=='store':
+        if series:
+            tracex.add(cellid, series)
+        return
+
+    AB = {}
+    for (j, var, times, values) in series:
+        if var=='Em':
+            for i in range(len(times)):
+                tracex.write('%d %d %g %g\n' % (cellid, j, times[i], values[i]))
+        else:
+            AB[var] = (times, values)
+    if AB:
+        (times, A) = AB['A']
+        B = AB['B'][1]
+        for i in range(len(times)):
+            tracex.write('%d %d %g %g\n' % (cellid+1000, 0, times[i], A[i]))
+            tracex.write('%d %d %g %g\n' % (cellid+1001, 0, times[i], B[i]))
+
+    tracex.flush()
+
+def trace_flush(gd):
+    """endWindow handler flushing the trace store"""
+    if tracex and trformat=='store':
+        if outq:
+            outq.put(tracex.flush)
+        else:
+            tracex.flush()
+
+def tracefile_close():
+    global tracex
+    if tracex:
+        if outq:
+            outq.drain()
+        tracex.close()
+        tracex = None
+
 def multi_trace_print(cell):
 
     if not cell.soma.emtrace: return
@@ -87,12 +171,17 @@ def multi_ca_trace_print(cell):
 
 def openTraceFile(tracex):
     if tracex==None:
+        ext = {'text': '.dat', 'store': '.trs'}[trformat]
         if mpi_size == 1:
-            fn = trfilename + '.dat'
+            fn = trfilename + ext
+        else:
+            fn = '%s_%d_%d%s' % \
+                 (trfilename, mpi_size, mpi_rank, ext)
+        if trformat=='store':
+            from tracestore import TraceWriter
+            tracex = TraceWriter(fn)
         else:
-            fn = '%s_%d_%d.dat' % \
-                 (trfilename, mpi_size, mpi_rank)
-        tracex = open(fn, 'w')
+            tracex = open(fn, 'w')
         message_print(debug, 'Open of trace file %s successful.\n' % fn)
     return tracex
 
@@ -143,12 +232,53 @@ def dumpcell(cell, msglevel):
         message_print(msglevel, ':::   Y[%d]=%g DYDT[%d]=%g\n' % (i, cell.Y[i], i, cell.DYDT[i]))
         
 
+def solverStats(gd, cell):
+    return 'cellid=%d method=%s tol=%g stepTotal=%d stepAccepts=%d (%g%%) functionCnt=%d jacobianCnt=%d newtonCnt=%d sparseLinearAlgebra=%s\n' % \
+           (cell.id, cell.method, gd.tolerance, cell.stepTotal, cell.stepAccepts, \
+            float(cell.stepAccepts)/float(max(cell.stepTotal, 1))*100.0, \
+            cell.functionCnt, cell.jacobianCnt, cell.newtonCnt, \
+            cell.sparseLinearAlgebra)
+
 def dumpSolverStats(gd, cell, msglevel):
-    message_print(msglevel, 'cellid=%d method=%s tol=%g stepTotal=%d stepAccepts=%d (%g%%) functionCnt=%d jacobianCnt=%d newtonCnt=%d sparseLinearAlgebra=%s\n' % \
-                  (cell.id, cell.method, gd.tolerance, cell.stepTotal, cell.stepAccepts, \
-                   float(cell.stepAccepts)/float(cell.stepTotal)*100.0, \
-                   cell.functionCnt, cell.jacobianCnt, cell.newtonCnt, \
-                   cell.sparseLinearAlgebra))
+    message_print(msglevel, solverStats(gd, cell))
+
+def writeSolverStats(gd, Network, fn):
+    """Write the solver statistics of every cell to the file fn"""
+    f = open(fn, 'w')
+    for cell in Network:
+        f.write(solverStats(gd, cell))
+    f.close()
+
+def readSolverStats(fn):
+    """The solver statistics written by writeSolverStats, a dict of
+    cellid: (stepTotal, stepAccepts, functionCnt)"""
+    import re
+    stats = {}
+    for l in open(fn):
+        o = re.search(r'cellid=(\d+) .*stepTotal=(\d+) stepAccepts=(\d+) .*'
+                      r'functionCnt=(\d+)', l)
+        if o:
+            (i, total, accepts, fcn) = [int(x) for x in o.groups()]
+            stats[i] = (total, accepts, fcn)
+    return stats
+
+def compareSolverStats(fn0, fn1, msglevel=info):
+    """Report the change in the steps taken and accepted per cell
+    between the solver statistics files fn0 and fn1"""
+    s0 = readSolverStats(fn0)
+    s1 = readSolverStats(fn1)
+    cells = sorted(set(s0.keys()) & set(s1.keys()))
+    if not cells:
+        message_print(msglevel, 'No cells in common.\n')
+        return
+    for (k, name) in [(0, 'steps'), (1, 'accepted steps')]:
+        n0 = sum([s0[i][k] for i in cells])
+        n1 = sum([s1[i][k] for i in cells])
+        fewer = len([i for i in cells if s1[i][k]<s0[i][k]])
+        message_print(msglevel, '%s per cell %.1f -> %.1f (%+.1f%%), '
+                      'fewer in %d of %d cells\n' %
+                      (name, float(n0)/len(cells), float(n1)/len(cells),
+                       (n1-n0)*100./max(n0, 1), fewer, len(cells)))
 
 def TimeTicker(gd):
     time = (gd.windowID+1)*gd.window
@@ -184,26 +314,109 @@ def CaDumper(cell):
 
 apx = None
 apfilename = 'ap'
+apformat = 'text'
 def setAPfilename(s):
     global apfilename
     apfilename = s
 
+def setAPformat(s):
+    """'text' for ap*.dat files, 'binary' for ap*.spk (see spikes.py)"""
+    global apformat
+    if s not in ['text', 'binary']:
+        raise ValueError, 'unknown AP file format %s' % s
+    apformat = s
+
+def apFileExt():
+    return {'text': '.dat', 'binary': '.spk'}[apformat]
+
 def openAPFile(apx):
     if apx==None:
         if mpi_size == 1:
-            fn = apfilename + '.dat'
+            fn = apfilename + apFileExt()
+        else:
+            fn = '%s_%d_%d%s' % \
+                 (apfilename, mpi_size, mpi_rank, apFileExt())
+        if apformat=='binary':
+            from spikes import SpikeWriter
+            apx = SpikeWriter(fn)
         else:
-            fn = '%s_%d_%d.dat' % \
-                 (apfilename, mpi_size, mpi_rank)
-        apx = open(fn, 'w')
+            apx = open(fn, 'w')
         message_print(debug, 'Open of AP file %s successful.\n' % fn)
     return apx
 
+def apfile_close():
+    global apx
+    if apx:
+        if outq:
+            outq.drain()
+        apx.close()
+        apx = None
+
 def ap_print(cell):
     global apx, apfilename
     apx = openAPFile(apx)
 
-    for tm in cell.soma.APtimes:
+    times = cell.soma.APtimes
+    if timeoffset:
+        times = [tm+timeoffset for tm in times]
+
+    if outq:
+        outq.put(ap_write, apx, cell.id, list(times), str(cell))
+        return
+
+    if apformat=='binary':
+        # buffered until the end of the window
+        apx.add(cell.id, times, str(cell))
+        return
+
+    for tm in times:
         apx.write('%d %g "%s"\n' % (cell.id, tm, cell))
 
     apx.flush()
+
+def ap_write(apx, cellid, times, name):
+    """The ap_print of a copy of a cell's APs"""
+    if apformat=='binary':
+        apx.add(cellid, times, name)
+        return
+
+    for tm in times:
+        apx.write('%d %g "%s"\n' % (cellid, tm, name))
+
+    apx.flush()
+
+def ap_flush(gd):
+    """endWindow handler writing out the buffered binary APs"""
+    if apx and apformat=='binary':
+        if outq:
+            outq.put(apx.flush)
+        else:
+            apx.flush()
+
+
+########################################
+# Output handed to a background writer #
+# thread (see asyncout.py)             #
+########################################
+outq = None
+def startAsyncOutput(maxsize=64):
+    """Have ap_print and trace_print queue their writes, at most
+    maxsize at a time, to a writer thread"""
+    global outq
+    from asyncout import AsyncWriter
+    stopAsyncOutput()
+    outq = AsyncWriter(maxsize)
+
+def stopAsyncOutput():
+    """Finish the queued writes and stop the writer thread.
+    Returns the seconds the handlers spent waiting for room in
+    the queue."""
+    global outq
+    if not outq:
+        return 0.
+    q = outq
+    outq = None
+    q.close()
+    message_print(debug, 'Output writer: %d writes, %d waited %gs\n' %
+                  (q.puts, q.waits, q.blocked))
+    return q.blocked
@@ -0,0 +1,167 @@
+"""
+Parameter sweeps of sprout_run.py on a pool of processes.
+
+A sweep point is a string of sprout_run.py arguments, eg
+'Vhalfmn=2 sprout=0.5', or a dict of parameters (see params.py). The
+points are run in-process by pool workers, as many at once as there
+are processors, and each worker is replaced after one run so that no
+simulator state leaks from one point to the next. Each run leaves in
+the results directory its AP file, named as sprout_run.py would name
+it ('ap <point>.dat'), and the solver statistics of its cells
+('stats <point>.dat'). A summary of the sweep is written to sweep.dat.
+
+In shared mode (-s) the cells and their connections are built once,
+before the pool is started, at the lowest sprouting level of the
+sweep. The workers are forked from the built network and each one
+only applies its own modifyAll parameters, rest states (warm=1) and
+sprouted connections before running, so construction is paid once per
+sweep rather than once per point. The points must then agree on the
+network size, cnxseed, seed, aggregate and restore_from.
+
+Usage: python sweep.py [-s] [-j nproc] [-o resultdir] point ...
+"""
+
+import sys, os
+from time import time
+from multiprocessing import Pool, cpu_count
+
+import sprout_run
+import params
+from granule import nc_sprout
+from p3 import message_print, info, fatal
+
+# The parameters that must be the same at every point of a shared sweep
+structural = ['ngcell', 'nbcell', 'nmcell', 'nhcell', 'cnxseed', 'seed',
+              'aggregate', 'restore_from']
+
+# (Network, edges, base sprouting level) of a shared sweep, built
+# before the pool is started so that the workers inherit it
+shared = None
+
+
+def pointName(point):
+    if isinstance(point, dict):
+        return params.describe(point)
+    return ' '.join(point.split())
+
+def outputs(point, resultdir):
+    apfn    = os.path.join(resultdir, ('ap %s' % point).strip())
+    statsfn = os.path.join(resultdir, ('stats %s' % point).strip() + '.dat')
+    trfn    = os.path.join(resultdir, ('trace %s' % point).strip())
+    return (apfn, statsfn, trfn)
+
+def runPoint(job):
+    (point, resultdir) = job
+    p = params.parse(point)
+    (apfn, statsfn, trfn) = outputs(point, resultdir)
+    start = time()
+    if shared:
+        (Network, edges, base) = shared
+        sprout_run.prepare(Network, p)
+        nc_sprout(edges, p['sprout'], base=base, seed=p['seed'],
+                  Network=Network)
+        ok = sprout_run.simulate(Network, p, apfn, statsfn, trfn)
+        if ok:
+            sprout_run.toCache(p, apfn, statsfn)
+    else:
+        ok = sprout_run.run(p, apfn, statsfn, trfn)
+    return (point, ok, time()-start)
+
+def buildShared(points):
+    """Build the network common to the sweep points"""
+    global shared
+    ps = [params.parse(point) for point in points]
+    p = dict(ps[0])
+    for q in ps[1:]:
+        for k in structural:
+            if q[k]!=p[k]:
+                raise ValueError, 'shared sweep points differ in %s' % k
+    p['sprout'] = min([q['sprout'] for q in ps])
+    start = time()
+    Network = sprout_run.makeCells(p)
+    edges = sprout_run.loadEdges(p)
+    sprout_run.connect(Network, p, edges)
+    shared = (Network, edges, p['sprout'])
+    message_print(info, 'Built the shared network in %.1fs\n' % (time()-start))
+
+def runSweep(points, resultdir='results', nproc=None, share=False):
+    """Run each of the sweep points, nproc at a time (default the
+    number of processors), building the network only once if share
+    is set. Returns a list of (point, ok, seconds)."""
+    global shared
+    if not os.path.isdir(resultdir):
+        os.makedirs(resultdir)
+    if nproc is None:
+        nproc = cpu_count()
+
+    start = time()
+    points = [pointName(point) for point in points]
+    results = []
+    todo = []
+    for point in points:
+        p = params.parse(point)
+        # converts the connectivity script here, once, rather than in
+        # every worker at once
+        sprout_run.cnxFile(p)
+        (apfn, statsfn, trfn) = outputs(point, resultdir)
+        if sprout_run.fromCache(p, apfn, statsfn):
+            results.append((point, True, 0.))
+        else:
+            todo.append(point)
+    if share and os.name=='nt':
+        # no fork, the workers could not inherit the network
+        message_print(info, 'Shared sweeps need fork, building per point.\n')
+        share = False
+    if share and todo:
+        buildShared(todo)
+    nproc = max(1, min(nproc, len(todo)))
+    message_print(info, 'Running %d of %d points on %d processes.\n' %
+                  (len(todo), len(points), nproc))
+    # each worker is forked afresh from this process for each point
+    pool = Pool(nproc, maxtasksperchild=1)
+    try:
+        jobs = [(point, resultdir) for point in todo]
+        for (point, ok, t) in pool.imap_unordered(runPoint, jobs):
+            if ok:
+                message_print(info, 'Done: %s (%.1fs)\n' % (point, t))
+            else:
+                message_print(fatal, 'Failed: %s\n' % point)
+            results.append((point, ok, t))
+        pool.close()
+    except:
+        pool.terminate()
+        shared = None
+        raise
+    pool.join()
+    shared = None
+
+    # Back in the order given
+    order = dict([(point, i) for (i, point) in enumerate(points)])
+    results.sort(key=lambda r: order[r[0]])
+    f = open(os.path.join(resultdir, 'sweep.dat'), 'w')
+    for (point, ok, t) in results:
+        f.write('%d %.3f "%s"\n' % (ok, t, point))
+    f.close()
+    message_print(info, 'Sweep of %d points took %.1fs\n' %
+                  (len(points), time()-start))
+    return results
+
+
+if __name__=='__main__':
+    nproc = None
+    resultdir = 'results'
+    share = False
+    args = sys.argv[1:]
+    while args and args[0] in ['-j', '-o', '-s']:
+        if args[0]=='-s':
+            share = True
+            args = args[1:]
+            continue
+        if len(args)<2: break
+        if args[0]=='-j': nproc = int(args[1])
+        else:             resultdir = args[1]
+        args = args[2:]
+    if not args:
+        print 'Usage: python sweep.py [-s] [-j nproc] [-o resultdir] point ...'
+        sys.exit(1)
+    runSweep(args, resultdir, nproc, share)
@@ -0,0 +1,230 @@
+"""
+Compressed trace files.
+
+The store equivalent of the text trace files written by
+support.trace_print. A trace is a series of samples of one variable
+of one compartment of one cell: the membrane potential 'Em' of a
+traced compartment, or the 'A' and 'B' states of a traced Exp2Syn.
+Each series is kept as two typed columns, float64 times and float64
+values.
+
+At the end of each window the new samples of a cell are written as
+one block, compressed with zlib (or lzma where it is available and
+asked for). Each block has a small uncompressed header naming its
+cell and series. The index of the blocks of each cell is also written
+once, as JSON in a footer, when the file is closed, so a reader goes
+straight to the blocks of the cell it wants. A file that was never
+closed (the run crashed) has no footer, and its index is rebuilt by
+scanning the block headers instead, up to the last whole block.
+
+File layout:
+   8 bytes        magic 'P3TRACE1'
+   8 bytes        NUL padded codec name
+   blocks         uint32 cellid, uint32 size, uint32 number of series
+                  per series: uint32 cmpt, 8 bytes var, uint32 n
+                  size bytes compressed, per series in the cell's order:
+                    float64[n] times, float64[n] values
+   footer         compressed JSON of
+                    {cellid: [[[cmpt, var], ...],
+                              [[offset, size, [n, ...]], ...]]}
+   uint64         footer offset
+   uint64         footer size
+   8 bytes        magic 'P3TRACE1'
+
+Usage (conversion to the text format):
+   python tracestore.py trace.trs [trace.dat]
+"""
+
+import sys, re, struct, zlib, json
+import numpy
+
+MAGIC = 'P3TRACE1'
+TRAILER = struct.Struct('<QQ8s')
+BLOCK   = struct.Struct('<III')
+SERIES  = struct.Struct('<I8sI')
+HEADER  = len(MAGIC) + 8
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+def _codec(name):
+    if name=='zlib':
+        return (lambda s: zlib.compress(s, 6), zlib.decompress)
+    if name=='lzma':
+        if lzma is None:
+            raise ImportError, 'the lzma codec needs the lzma module'
+        return (lzma.compress, lzma.decompress)
+    raise ValueError, 'unknown codec %s' % name
+
+
+class TraceWriter:
+    """Writer of a compressed trace file"""
+    def __init__(self, fn, codec='zlib'):
+        self.fn = fn
+        self.codec = codec
+        (self.compress, decompress) = _codec(codec)
+        self.f = open(fn, 'wb')
+        self.f.write(MAGIC)
+        self.f.write(struct.pack('8s', codec))
+        self.index = {}
+
+    def add(self, cellid, series):
+        """Write a block of samples of a cell. series is a list of
+        (cmpt, var, times, values), in the same order for every
+        block of the cell."""
+        names = [(cmpt, var) for (cmpt, var, times, values) in series]
+        if cellid not in self.index:
+            self.index[cellid] = (names, [])
+        elif self.index[cellid][0]!=names:
+            raise ValueError, 'traced variables of cell %d changed' % cellid
+        counts = []
+        cols = []
+        heads = []
+        for (cmpt, var, times, values) in series:
+            if len(var)>8:
+                raise ValueError, 'variable name %s is too long' % var
+            times  = numpy.asarray(times, dtype='<f8')
+            values = numpy.asarray(values, dtype='<f8')
+            if len(times)!=len(values):
+                raise ValueError, 'times and values differ in length'
+            counts.append(len(times))
+            heads.append(SERIES.pack(cmpt, var, len(times)))
+            cols.append(times.tostring())
+            cols.append(values.tostring())
+        if not sum(counts): return
+        data = self.compress(''.join(cols))
+        self.f.write(BLOCK.pack(cellid, len(data), len(series)))
+        self.f.write(''.join(heads))
+        self.index[cellid][1].append((self.f.tell(), len(data), counts))
+        self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        offset = self.f.tell()
+        footer = self.compress(json.dumps(self.index))
+        self.f.write(footer)
+        self.f.write(TRAILER.pack(offset, len(footer), MAGIC))
+        self.f.close()
+
+
+class TraceReader:
+    """Random access reader of a compressed trace file"""
+    def __init__(self, fn):
+        self.fn = fn
+        self.f = open(fn, 'rb')
+        if self.f.read(len(MAGIC))!=MAGIC:
+            raise IOError, '%s is not a trace file' % fn
+        self.codec = self.f.read(8).rstrip('\0')
+        self.decompress = _codec(self.codec)[1]
+        self.f.seek(0, 2)
+        end = self.f.tell()
+        magic = None
+        if end>=HEADER+TRAILER.size:
+            self.f.seek(-TRAILER.size, 2)
+            (offset, size, magic) = TRAILER.unpack(self.f.read(TRAILER.size))
+        if magic==MAGIC:
+            self.f.seek(offset)
+            index = json.loads(self.decompress(self.f.read(size)))
+            self.index = {}
+            for (cellid, (names, blocks)) in index.items():
+                names = [(cmpt, str(var)) for (cmpt, var) in names]
+                self.index[int(cellid)] = (names, blocks)
+        else:
+            # not closed, no footer
+            self.index = self.scan(end)
+
+    def scan(self, end):
+        """Index of the blocks of the file, read from their headers up
+        to the last one that was written whole before end"""
+        index = {}
+        pos = HEADER
+        while pos+BLOCK.size<=end:
+            self.f.seek(pos)
+            (cellid, size, nseries) = BLOCK.unpack(self.f.read(BLOCK.size))
+            offset = pos + BLOCK.size + nseries*SERIES.size
+            if offset+size>end:
+                break
+            heads = [SERIES.unpack(self.f.read(SERIES.size))
+                     for i in range(nseries)]
+            names = [(cmpt, var.rstrip('\0')) for (cmpt, var, n) in heads]
+            counts = [n for (cmpt, var, n) in heads]
+            if cellid not in index:
+                index[cellid] = (names, [])
+            index[cellid][1].append((offset, size, counts))
+            pos = offset + size
+        return index
+
+    def cells(self):
+        return sorted(self.index.keys())
+
+    def variables(self, cellid):
+        """The (cmpt, var) traced in cell cellid"""
+        return list(self.index[cellid][0])
+
+    def read(self, cellid):
+        """All the traces of cell cellid.
+        Returns {(cmpt, var): (times, values)}"""
+        (names, blocks) = self.index[cellid]
+        cols = [([], []) for name in names]
+        for (offset, size, counts) in blocks:
+            self.f.seek(offset)
+            data = self.decompress(self.f.read(size))
+            pos = 0
+            for (i, n) in enumerate(counts):
+                for c in cols[i]:
+                    c.append(numpy.frombuffer(data, '<f8', n, pos))
+                    pos = pos + 8*n
+        traces = {}
+        for (name, (times, values)) in zip(names, cols):
+            if times:
+                traces[name] = (numpy.concatenate(times),
+                                numpy.concatenate(values))
+            else:
+                traces[name] = (numpy.zeros(0), numpy.zeros(0))
+        return traces
+
+    def trace(self, cellid, cmpt=0, var='Em'):
+        """One trace. Returns (times, values)"""
+        return self.read(cellid)[(cmpt, var)]
+
+    def close(self):
+        self.f.close()
+
+
+def toText(fn, textfn):
+    """Convert the trace file fn to the text trace format, in which
+    Exp2Syn A and B are cells id+1000 and id+1001"""
+    r = TraceReader(fn)
+    f = open(textfn, 'w')
+    fake = {'A': 1000, 'B': 1001}
+    for cellid in r.cells():
+        traces = r.read(cellid)
+        for (cmpt, var) in r.variables(cellid):
+            (times, values) = traces[(cmpt, var)]
+            if var in fake:
+                (i, j) = (cellid+fake[var], 0)
+            else:
+                (i, j) = (cellid, cmpt)
+            for (t, v) in zip(times.tolist(), values.tolist()):
+                f.write('%d %d %g %g\n' % (i, j, t, v))
+    f.close()
+    r.close()
+
+
+if __name__=='__main__':
+    if len(sys.argv) not in [2, 3]:
+        print 'Usage: python tracestore.py trace.trs [trace.dat]'
+        sys.exit(1)
+    fn = sys.argv[1]
+    if len(sys.argv)==3:
+        textfn = sys.argv[2]
+    else:
+        textfn = re.sub(r'\.trs$', '', fn) + '.dat'
+    toText(fn, textfn)
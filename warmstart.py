@@ -0,0 +1,113 @@
+"""
+Steady state initial conditions for the cells of the network.
+
+A new cell starts at its leak potential with its gates at their steady
+state values there, which is not the cell's resting state, so every
+cell of every run relaxes for a while before the input means anything.
+warmStart integrates one isolated, unconnected cell of each class with
+the run's channel modifications to rest and loads the resulting state
+vector into every cell of that class.
+
+The rest states are cached, in memory and in a directory of .npy
+files, keyed by the cell class, useSlow, the modifyAll parameters, the
+settling time and tolerance and the digests of the compiled model.
+"""
+
+import os
+from hashlib import sha1
+import numpy
+from p3 import GD, parplex, message_print, info, warn
+import granule
+
+CACHEDIR = 'warmstart'
+SETTLE   = 500.         # ms of integration to reach rest
+TOLERANCE = 1e-3
+
+_states = {}
+
+
+def stateKey(cls, useSlow, mods, settle=SETTLE, tolerance=TOLERANCE,
+             aggregate=False):
+    import runcache
+    h = sha1()
+    h.update('%s %r %r %r\n' % (cls.__name__, bool(useSlow), float(settle),
+                                 float(tolerance)))
+    if aggregate:
+        h.update('aggregate\n')
+    for k in sorted(mods.keys()):
+        h.update('%s=%r\n' % (k, mods[k]))
+    for name in ['aradi', 'Exp2Syn', 'parplex._p3', 'granule']:
+        h.update('%s=%s\n' % (name, runcache.moduleDigest(name)))
+    return h.hexdigest()
+
+def settle(cls, useSlow, mods, duration=SETTLE, tolerance=TOLERANCE,
+           aggregate=False):
+    """Integrate one isolated cell of class cls for duration ms.
+    Returns its final state vector"""
+    cell = cls(useSlow=useSlow)
+    cell.aggregate = aggregate
+    cell.makesynapses()
+    granule.modifyAll(Network=[cell], **mods)
+    gd = GD()
+    gd.duration  = duration
+    gd.tolerance = tolerance
+    gd.minStep   = 0.05
+    gd.network   = [cell]
+    parplex(gd)
+    Y1 = numpy.array(list(cell.Y))
+    if len(cell.soma.APtimes):
+        message_print(warn, 'An isolated %s fires, it has no rest state.\n'
+                      % cell)
+    # a short second stretch to check the state has stopped moving
+    gd = GD()
+    gd.duration  = 20
+    gd.tolerance = tolerance
+    gd.minStep   = 0.05
+    gd.network   = [cell]
+    parplex(gd)
+    drift = abs(numpy.array(list(cell.Y)) - Y1).max()
+    if drift>1e-2:
+        message_print(warn, 'A %s is still moving after %gms (%g).\n'
+                      % (cell, duration, drift))
+    return Y1
+
+def restState(cls, useSlow, mods, duration=SETTLE, tolerance=TOLERANCE,
+              cachedir=CACHEDIR, aggregate=False):
+    """The rest state vector of a cell of class cls, from the cache
+    if it has been found before"""
+    key = stateKey(cls, useSlow, mods, duration, tolerance, aggregate)
+    if key in _states:
+        return _states[key]
+    fn = os.path.join(cachedir, key + '.npy')
+    if os.path.exists(fn):
+        Y = numpy.load(fn)
+    else:
+        message_print(info, 'Settling a %s for %gms.\n' % (cls.__name__,
+                                                          duration))
+        Y = settle(cls, useSlow, mods, duration, tolerance, aggregate)
+        if not os.path.isdir(cachedir):
+            try:
+                os.makedirs(cachedir)
+            except OSError:
+                pass
+        tmp = '%s.%d.npy' % (fn[:-4], os.getpid())
+        numpy.save(tmp, Y)
+        os.rename(tmp, fn)
+    _states[key] = Y
+    return Y
+
+def warmStart(Network, useSlow, mods, duration=SETTLE, tolerance=TOLERANCE):
+    """Load the rest state of its class into every cell of Network.
+    mods are the modifyAll parameters the network was made with."""
+    classes = {}
+    for cell in Network:
+        classes.setdefault(cell.__class__, []).append(cell)
+    for (cls, cells) in classes.items():
+        aggregate = getattr(cells[0], 'aggregate', False)
+        Y = restState(cls, useSlow, mods, duration, tolerance,
+                      aggregate=aggregate).tolist()
+        for cell in cells:
+            if len(cell.Y)!=len(Y):
+                raise ValueError, 'a %s has %d state variables, not %d' % \
+                      (cell, len(cell.Y), len(Y))
+            cell.Y[:] = Y